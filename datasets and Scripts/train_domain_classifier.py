@@ -0,0 +1,230 @@
+"""
+Train the domain gate that refuses non-database prompts before the model call.
+
+Positives are the database questions in dataset/dataset.jsonl; negatives are
+its refusal rows (completion "Sorry, I can only answer questions related to
+SQL and NoSQL databases.") plus any extra off-topic prompts passed with
+--negatives. The fitted TF-IDF (word + char_wb) + logistic regression weights
+are exported to the JSON artifact scored by
+sql-chat-app/backend/api/domain_gate.py.
+
+A wrongly refused database question is worse than an off-topic prompt
+reaching the model (which refuses it anyway), so the threshold is the lowest
+one that still refuses --offtopic-recall of the off-topic prompts. The
+dataset prompts are all self-contained questions, so the backend only gates
+the opening message of a conversation, never context-dependent follow-ups.
+
+The threshold is picked from 5-fold cross-validated scores on all prompts,
+and the reported precision/recall are those same out-of-fold predictions, so
+they describe the shipped model's training recipe rather than a single split
+(they are slightly optimistic, since the threshold was tuned on them). The
+shipped model is then refit on all prompts. Also prints per-prompt scoring
+latency of the runtime scorer and the share of traffic that would be refused. Pass a
+conversation export (`manage.py export_conversations --all --layout dataset`)
+with --traffic to estimate the shed rate on real chats.
+
+Requires scikit-learn in addition to the backend requirements:
+
+    pip install scikit-learn
+    python train_domain_classifier.py
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import precision_recall_fscore_support
+from sklearn.model_selection import StratifiedKFold, cross_val_predict
+from sklearn.pipeline import FeatureUnion, make_pipeline
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+BACKEND_DIR = SCRIPTS_DIR.parent / 'sql-chat-app' / 'backend'
+sys.path.insert(0, str(BACKEND_DIR))
+
+from api.domain_gate import REFUSAL_MESSAGE, DomainClassifier  # noqa: E402
+
+TOKEN_PATTERN = r"(?u)\b\w\w+\b"
+WORD_NGRAM_RANGE = (1, 2)
+CHAR_NGRAM_RANGE = (3, 5)
+CV_FOLDS = 5
+
+
+def load_prompts(path):
+    """Return (prompts, labels) with label 1 for database questions."""
+    prompts, labels = [], []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            row = json.loads(line)
+            prompts.append(row['prompt'])
+            labels.append(0 if row.get('completion', '').startswith(REFUSAL_MESSAGE[:40]) else 1)
+    return prompts, labels
+
+
+def load_negatives(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line)['prompt'] for line in f if line.strip()]
+
+
+def dedupe(prompts, labels):
+    seen = {}
+    for prompt, label in zip(prompts, labels):
+        seen.setdefault(prompt.strip().lower(), (prompt, label))
+    return [p for p, _ in seen.values()], [l for _, l in seen.values()]
+
+
+def build_model(c):
+    vectorizer = FeatureUnion([
+        ('word', TfidfVectorizer(
+            analyzer='word',
+            token_pattern=TOKEN_PATTERN,
+            ngram_range=WORD_NGRAM_RANGE,
+            sublinear_tf=True,
+            min_df=2,
+        )),
+        ('char_wb', TfidfVectorizer(
+            analyzer='char_wb',
+            ngram_range=CHAR_NGRAM_RANGE,
+            sublinear_tf=True,
+            min_df=2,
+        )),
+    ])
+    classifier = LogisticRegression(C=c, class_weight='balanced', max_iter=2000)
+    return vectorizer, classifier
+
+
+def pick_threshold(probabilities, labels, offtopic_recall):
+    """Lowest threshold that refuses ``offtopic_recall`` of the off-topic prompts."""
+    off_topic = np.sort(probabilities[np.asarray(labels) == 0])
+    index = int(np.ceil(offtopic_recall * len(off_topic))) - 1
+    # Midway to the next score so that prompt is refused too.
+    upper = off_topic[index + 1] if index + 1 < len(off_topic) else 1.0
+    return float((off_topic[index] + upper) / 2)
+
+
+def export(vectorizer, classifier, threshold, metrics):
+    coef = classifier.coef_[0]
+    features = []
+    offset = 0
+    for name, block in vectorizer.transformer_list:
+        idf = block.idf_
+        features.append({
+            'analyzer': block.analyzer,
+            'ngram_range': list(block.ngram_range),
+            **({'token_pattern': block.token_pattern} if block.analyzer == 'word' else {}),
+            'vocabulary': {
+                term: [round(float(idf[i]), 6), round(float(coef[offset + i]), 6)]
+                for term, i in block.vocabulary_.items()
+            },
+        })
+        offset += len(block.vocabulary_)
+    return {
+        'version': 2,
+        'trained_at': datetime.now(timezone.utc).isoformat(),
+        'intercept': float(classifier.intercept_[0]),
+        'threshold': threshold,
+        'metrics': metrics,
+        'features': features,
+    }
+
+
+def report(name, labels, predictions):
+    precision, recall, f1, support = precision_recall_fscore_support(labels, predictions, labels=[0, 1], zero_division=0)
+    print(f"{name}")
+    print(f"  {'class':<12}{'precision':>10}{'recall':>10}{'f1':>10}{'support':>10}")
+    for index, label in enumerate(('off-topic', 'database')):
+        print(f"  {label:<12}{precision[index]:>10.3f}{recall[index]:>10.3f}{f1[index]:>10.3f}{support[index]:>10}")
+    return {
+        'off_topic_precision': round(float(precision[0]), 4),
+        'off_topic_recall': round(float(recall[0]), 4),
+        'database_precision': round(float(precision[1]), 4),
+        'database_recall': round(float(recall[1]), 4),
+    }
+
+
+def measure_latency(scorer, prompts, repeat=5):
+    samples = []
+    for _ in range(repeat):
+        for prompt in prompts:
+            start = time.perf_counter()
+            scorer.score(prompt)
+            samples.append(time.perf_counter() - start)
+    samples.sort()
+    return {
+        'mean_us': round(statistics.mean(samples) * 1e6, 1),
+        'p99_us': round(samples[int(len(samples) * 0.99) - 1] * 1e6, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dataset', default=SCRIPTS_DIR / 'dataset' / 'dataset.jsonl', type=Path)
+    parser.add_argument('--negatives', type=Path, help="Extra off-topic prompts, one {\"prompt\": ...} per line")
+    parser.add_argument('--traffic', type=Path, help="Chat export (dataset layout) to estimate the shed rate on")
+    parser.add_argument('--output', default=BACKEND_DIR / 'api' / 'data' / 'domain_classifier.json', type=Path)
+    parser.add_argument('--offtopic-recall', type=float, default=0.95,
+                        help="Share of off-topic prompts the gate must refuse")
+    parser.add_argument('--C', type=float, default=4.0, help="Inverse regularization strength")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    prompts, labels = load_prompts(args.dataset)
+    if args.negatives:
+        extra = load_negatives(args.negatives)
+        prompts += extra
+        labels += [0] * len(extra)
+    prompts, labels = dedupe(prompts, labels)
+    print(f"{len(prompts)} unique prompts: {sum(labels)} database, {len(labels) - sum(labels)} off-topic")
+
+    # Out-of-fold scores on all prompts; the vectorizer is refit inside each
+    # fold so held-out prompts never contribute vocabulary or IDF weights.
+    folds = StratifiedKFold(n_splits=CV_FOLDS, shuffle=True, random_state=args.seed)
+    oof = cross_val_predict(make_pipeline(*build_model(args.C)), prompts, labels, cv=folds,
+                            method='predict_proba')[:, 1]
+    threshold = pick_threshold(oof, labels, args.offtopic_recall)
+    print(f"Threshold for {args.offtopic_recall:.1%} off-topic recall: {threshold:.4f}")
+
+    predictions = [int(score >= threshold) for score in oof]
+    metrics = report(f"{CV_FOLDS}-fold cross-validated", labels, predictions)
+    metrics['evaluation'] = f'{CV_FOLDS}-fold cross-validation'
+    metrics['shed_rate_dataset'] = round(1 - sum(predictions) / len(predictions), 4)
+    print(f"Refused without a model call on dataset prompts: {metrics['shed_rate_dataset']:.1%}")
+
+    # The shipped model: all prompts, the cross-validated threshold.
+    vectorizer, classifier = build_model(args.C)
+    classifier.fit(vectorizer.fit_transform(prompts), labels)
+    scorer = DomainClassifier.from_artifact(export(vectorizer, classifier, threshold, {}))
+
+    # The runtime scorer must agree with scikit-learn.
+    reference = classifier.predict_proba(vectorizer.transform(prompts))[:, 1]
+    drift = max(abs(scorer.score(p) - r) for p, r in zip(prompts, reference))
+    print(f"Max |runtime - sklearn| probability difference: {drift:.2e}")
+
+    latency = measure_latency(scorer, prompts)
+    print(f"Runtime scoring latency: mean {latency['mean_us']} us, p99 {latency['p99_us']} us")
+    metrics['latency'] = latency
+    artifact = export(vectorizer, classifier, threshold, metrics)
+
+    if args.traffic:
+        traffic = load_negatives(args.traffic)
+        refused = sum(1 for p in traffic if not scorer.is_on_topic(p))
+        metrics['shed_rate_traffic'] = round(refused / len(traffic), 4) if traffic else 0.0
+        print(f"Refused without a model call on {len(traffic)} exported chats: {metrics['shed_rate_traffic']:.1%}")
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(artifact, f, ensure_ascii=False, separators=(',', ':'))
+    print(f"Wrote {sum(len(block['vocabulary']) for block in artifact['features'])} terms to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,16 @@
+# api/bulk.py
+"""Helpers for bulk writes shared by the import and retention code."""
+
+
+def restore_timestamps(model, objs, stamps, fields):
+    """
+    Write back original timestamps after ``bulk_create``.
+
+    auto_now / auto_now_add overwrite timestamps during bulk_create, but
+    bulk_update writes attribute values as-is.
+    """
+    for obj, values in zip(objs, stamps):
+        for field, value in zip(fields, values):
+            if value is not None:
+                setattr(obj, field, value)
+    model.objects.bulk_update(objs, fields)
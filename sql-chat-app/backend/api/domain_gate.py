@@ -0,0 +1,152 @@
+# api/domain_gate.py
+"""
+In-process gate that refuses off-topic prompts before any model call.
+
+The classifier is a logistic regression over two TF-IDF blocks (word 1-2 grams
+and char_wb 3-5 grams, both sublinear tf and l2-normalized) trained by
+``datasets and Scripts/train_domain_classifier.py``. Its weights are exported
+to a JSON artifact and scored here in pure Python, so the web workers do not
+need scikit-learn and a prompt is scored in tens of microseconds. The
+artifact is loaded once per process (in the gunicorn master when
+``preload_app`` is on).
+
+The gate only sees the first message of a new conversation (see
+``ChatView.submit``). It has no conversation context and its training data
+has no short follow-ups, so messages in an existing conversation go straight
+to the model, which refuses off-topic ones itself.
+"""
+
+import json
+import logging
+import math
+import re
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Same reply the fine-tuned model gives for non-database questions.
+REFUSAL_MESSAGE = "Sorry, I can only answer questions related to SQL and NoSQL databases."
+
+WHITESPACE_RE = re.compile(r"\s\s+")
+
+
+class FeatureBlock:
+    """One TF-IDF vectorizer: n-gram extraction plus per-term (idf, coef)."""
+
+    def __init__(self, analyzer, ngram_range, vocabulary, token_pattern=r"(?u)\b\w\w+\b"):
+        if analyzer not in ('word', 'char_wb'):
+            raise ValueError(f"Unsupported analyzer '{analyzer}'")
+        self.analyzer = analyzer
+        self.ngram_range = tuple(ngram_range)
+        # term -> (idf, coef)
+        self.vocabulary = vocabulary
+        self.token_re = re.compile(token_pattern)
+
+    def ngrams(self, text):
+        low, high = self.ngram_range
+        if self.analyzer == 'word':
+            tokens = self.token_re.findall(text)
+            for n in range(low, high + 1):
+                for i in range(len(tokens) - n + 1):
+                    yield ' '.join(tokens[i:i + n])
+            return
+
+        # Mirrors scikit-learn's char_wb analyzer.
+        for word in WHITESPACE_RE.sub(' ', text).split():
+            word = f' {word} '
+            for n in range(low, high + 1):
+                if len(word) <= n:
+                    # A short word is counted once, then longer n are skipped.
+                    yield word
+                    break
+                for i in range(len(word) - n + 1):
+                    yield word[i:i + n]
+
+    def decision(self, text):
+        """Contribution of this block to the logit (0.0 if no known terms)."""
+        counts = Counter(term for term in self.ngrams(text) if term in self.vocabulary)
+        norm = 0.0
+        dot = 0.0
+        for term, count in counts.items():
+            idf, coef = self.vocabulary[term]
+            weight = (1 + math.log(count)) * idf
+            norm += weight * weight
+            dot += weight * coef
+        return dot / math.sqrt(norm) if norm else 0.0
+
+
+class DomainClassifier:
+    """Pure-Python scorer for an exported TF-IDF + logistic regression model."""
+
+    def __init__(self, blocks, intercept, threshold, metrics=None):
+        self.blocks = blocks
+        self.intercept = intercept
+        self.threshold = threshold
+        self.metrics = metrics or {}
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding='utf-8') as f:
+            return cls.from_artifact(json.load(f))
+
+    @classmethod
+    def from_artifact(cls, artifact):
+        blocks = [
+            FeatureBlock(
+                analyzer=block['analyzer'],
+                ngram_range=block['ngram_range'],
+                vocabulary={term: tuple(values) for term, values in block['vocabulary'].items()},
+                **({'token_pattern': block['token_pattern']} if 'token_pattern' in block else {}),
+            )
+            for block in artifact['features']
+        ]
+        return cls(blocks, artifact['intercept'], artifact['threshold'], artifact.get('metrics'))
+
+    @property
+    def term_count(self):
+        return sum(len(block.vocabulary) for block in self.blocks)
+
+    def score(self, text):
+        """Probability that ``text`` is a database question."""
+        text = text.lower()
+        decision = self.intercept + sum(block.decision(text) for block in self.blocks)
+        return 1 / (1 + math.exp(-decision))
+
+    def is_on_topic(self, text):
+        return self.score(text) >= self.threshold
+
+
+def get_classifier():
+    """
+    Load and cache the classifier. Returns None when the gate is disabled or
+    the artifact is missing, in which case every prompt is let through.
+    """
+    # Use a function attribute as a simple cache, like get_gradio_client
+    if hasattr(get_classifier, "_classifier"):
+        return getattr(get_classifier, "_classifier")
+
+    classifier = None
+    path = Path(settings.DOMAIN_GATE_MODEL_PATH)
+    if not settings.DOMAIN_GATE_ENABLED:
+        logger.info("Domain gate disabled")
+    elif not path.exists():
+        logger.warning(f"Domain gate artifact not found at {path}; gate disabled")
+    else:
+        classifier = DomainClassifier.load(path)
+        if settings.DOMAIN_GATE_THRESHOLD is not None:
+            classifier.threshold = settings.DOMAIN_GATE_THRESHOLD
+        logger.info(
+            f"Loaded domain gate from {path} ({classifier.term_count} terms, "
+            f"threshold {classifier.threshold:.3f})"
+        )
+
+    setattr(get_classifier, "_classifier", classifier)
+    return classifier
+
+
+def is_on_topic(text):
+    classifier = get_classifier()
+    return classifier is None or classifier.is_on_topic(text)
@@ -0,0 +1,190 @@
+# api/idempotency.py
+"""
+Duplicate suppression for chat submissions.
+
+Two layers work together:
+
+- ``SingleFlight`` coalesces concurrent identical submissions inside one worker
+  process (same user, conversation and content, e.g. a double-click) so they
+  share a single model call and a single set of persisted messages.
+- ``IdempotencyRecord`` rows store the result of a submission under the
+  client-supplied ``Idempotency-Key`` header for ``CHAT_IDEMPOTENCY_TTL_SECONDS``.
+  Because the key is claimed through a unique constraint, retries are
+  deduplicated across workers and restarts, not just within a process. A key
+  still in flight after ``CHAT_IDEMPOTENCY_LEASE_SECONDS`` is considered
+  abandoned (its worker was killed) and the next retry takes it over.
+
+Submissions without a key are coalesced across workers by ``coalesce()``,
+which claims an implicit record keyed by the request fingerprint. It only
+absorbs duplicates while the first submission runs and for
+``CHAT_COALESCE_WINDOW_SECONDS`` after it finished, so asking the same
+question again later still reaches the model.
+"""
+
+import hashlib
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import IdempotencyRecord
+
+MAX_KEY_LENGTH = IdempotencyRecord._meta.get_field('key').max_length
+# Keys of the implicit records written by coalesce(); reserved for the server.
+COALESCE_KEY_PREFIX = 'coalesce:'
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Run at most one call per key at a time; concurrent callers share its result."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        """
+        Call ``fn()`` unless a call for ``key`` is already running, in which
+        case wait for it. Returns ``(result, shared)``; exceptions raised by
+        the leader are re-raised in every waiter.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+
+def request_fingerprint(*parts):
+    """Stable hash of the fields that identify a chat submission."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode('utf-8'))
+        digest.update(b'\x00')
+    return digest.hexdigest()
+
+
+def _stale():
+    """
+    Completed records past the TTL (or, for implicit ones, past the coalesce
+    window) and in-flight ones past their lease.
+    """
+    now = timezone.now()
+    expired = Q(created_at__lt=now - timedelta(seconds=settings.CHAT_IDEMPOTENCY_TTL_SECONDS))
+    abandoned = Q(
+        response__isnull=True,
+        created_at__lt=now - timedelta(seconds=settings.CHAT_IDEMPOTENCY_LEASE_SECONDS),
+    )
+    coalesced = Q(
+        key__startswith=COALESCE_KEY_PREFIX,
+        completed_at__lt=now - timedelta(seconds=settings.CHAT_COALESCE_WINDOW_SECONDS),
+    )
+    return expired | abandoned | coalesced
+
+
+def claim(user, key, request_hash):
+    """
+    Reserve ``key`` for ``user``. Returns ``(record, created)``; ``created`` is
+    False when another request already owns the key.
+    """
+    while True:
+        IdempotencyRecord.objects.filter(_stale(), user=user, key=key).delete()
+        try:
+            with transaction.atomic():
+                record = IdempotencyRecord.objects.create(user=user, key=key, request_hash=request_hash)
+            return record, True
+        except IntegrityError:
+            record = IdempotencyRecord.objects.filter(user=user, key=key).first()
+            if record is not None:
+                return record, False
+            # The owner released the key between our insert and this read.
+
+
+def complete(record, response):
+    record.response = response
+    record.completed_at = timezone.now()
+    # update() rather than save(): if the lease ran out and a retry took the
+    # key over, the row is gone and there is nothing left to store.
+    IdempotencyRecord.objects.filter(pk=record.pk).update(
+        response=response, completed_at=record.completed_at
+    )
+
+
+def release(record):
+    """Forget a key whose request failed so the client can retry it."""
+    IdempotencyRecord.objects.filter(pk=record.pk, response__isnull=True).delete()
+
+
+def wait_for_result(record, timeout=None, interval=0.25):
+    """
+    Poll until the request owning ``record`` stores its response. Returns the
+    response, or None if it did not finish within ``timeout`` or was released.
+    """
+    timeout = settings.CHAT_IDEMPOTENCY_WAIT_SECONDS if timeout is None else timeout
+    deadline = time.monotonic() + timeout
+    while True:
+        rows = list(IdempotencyRecord.objects.filter(pk=record.pk).values_list('response', flat=True))
+        if not rows:
+            return None
+        if rows[0] is not None or time.monotonic() >= deadline:
+            return rows[0]
+        time.sleep(interval)
+
+
+def coalesce(user, fingerprint, fn):
+    """
+    Call ``fn()`` once for identical submissions from ``user`` across all
+    workers. Returns ``(result, shared)`` like ``SingleFlight.do``.
+
+    A duplicate waits for the running submission the same way a reused
+    Idempotency-Key does. Because the client did not ask for idempotency, a
+    duplicate whose original does not finish in time (or fails and releases
+    the record) runs ``fn()`` itself rather than returning an error.
+    """
+    record, created = claim(user, COALESCE_KEY_PREFIX + fingerprint, fingerprint)
+    if not created:
+        result = record.response or wait_for_result(record)
+        if result is not None:
+            return result, True
+        return fn(), False
+
+    try:
+        result = fn()
+    except Exception:
+        release(record)
+        raise
+    complete(record, result)
+    return result, False
+
+
+def purge_expired():
+    """Delete records past the TTL or abandoned in flight. Returns the number removed."""
+    deleted, _ = IdempotencyRecord.objects.filter(_stale()).delete()
+    return deleted
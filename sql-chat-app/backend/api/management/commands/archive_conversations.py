@@ -0,0 +1,80 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from django.utils import timezone
+
+from api import retention
+
+
+def format_bytes(value):
+    if value is None:
+        return 'n/a'
+    if value < 1024:
+        return f"{value} B"
+    for unit in ('KiB', 'MiB', 'GiB'):
+        value /= 1024
+        if value < 1024 or unit == 'GiB':
+            return f"{value:.1f} {unit}"
+
+
+class Command(BaseCommand):
+    help = (
+        "Move messages of conversations inactive for more than N days into "
+        "zstd-compressed archive rows. Safe to run from cron; each conversation "
+        "is moved in its own short transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.CONVERSATION_ARCHIVE_AFTER_DAYS,
+                            help="Archive conversations not updated for this many days")
+        parser.add_argument('--batch-size', type=int, default=settings.CONVERSATION_ARCHIVE_BATCH_SIZE)
+        parser.add_argument('--max-batches', type=int, help="Stop after this many batches")
+        parser.add_argument('--dry-run', action='store_true', help="Only report what would be archived")
+        parser.add_argument('--report-only', action='store_true', help="Print the table report and exit")
+
+    def print_report(self, label, report):
+        self.stdout.write(f"{label}:")
+        self.stdout.write(f"  hot messages:            {report['hot_messages']}")
+        self.stdout.write(f"  message table size:      {format_bytes(report['message_table_bytes'])}")
+        self.stdout.write(
+            f"  archived conversations:  {report['archived_conversations']} / {report['conversations']}"
+        )
+        self.stdout.write(f"  archived messages:       {report['archived_messages']}")
+        self.stdout.write(
+            f"  archive payload:         {format_bytes(report['archive_compressed_bytes'])} "
+            f"(raw {format_bytes(report['archive_raw_bytes'])})"
+        )
+        self.stdout.write(f"  archive table size:      {format_bytes(report['archive_table_bytes'])}")
+
+    def handle(self, *args, **options):
+        before = retention.hot_table_report()
+        self.print_report("Before", before)
+        if options['report_only']:
+            return
+
+        if options['dry_run']:
+            cutoff = timezone.now() - timedelta(days=options['days'])
+            candidates = retention.archivable_conversations(cutoff).aggregate(
+                conversations=Count('id', distinct=True),
+                messages=Count('messages'),
+            )
+            self.stdout.write(
+                f"Would archive {candidates['conversations']} conversations "
+                f"({candidates['messages']} messages) inactive for {options['days']}+ days"
+            )
+            return
+
+        totals = retention.archive_inactive(
+            days=options['days'],
+            batch_size=options['batch_size'],
+            max_batches=options['max_batches'],
+        )
+        ratio = totals['raw_bytes'] / totals['compressed_bytes'] if totals['compressed_bytes'] else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {totals['conversations']} conversations ({totals['messages']} messages) "
+            f"in {totals['batches']} batches; {format_bytes(totals['raw_bytes'])} -> "
+            f"{format_bytes(totals['compressed_bytes'])} ({ratio:.1f}x)"
+        ))
+        self.print_report("After", retention.hot_table_report())
@@ -0,0 +1,47 @@
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from api import transfer
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream conversations to NDJSON. Use --layout dataset to emit "
+        "prompt/completion rows in dataset.jsonl format."
+    )
+
+    def add_arguments(self, parser):
+        target = parser.add_mutually_exclusive_group(required=True)
+        target.add_argument('--user', help="Username whose conversations are exported")
+        target.add_argument('--all', action='store_true', help="Export conversations of every user")
+        parser.add_argument('--output', '-o', default='-', help="Output file (default: stdout)")
+        parser.add_argument('--layout', choices=transfer.EXPORT_LAYOUTS, default='records')
+        parser.add_argument('--gzip', action='store_true', help="gzip-compress the output")
+        parser.add_argument('--chunk-size', type=int, default=transfer.DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"User '{options['user']}' does not exist")
+
+        rows = transfer.iter_export(user, layout=options['layout'], chunk_size=options['chunk_size'])
+        chunks = transfer.iter_ndjson(rows, compress=options['gzip'])
+
+        if options['output'] == '-':
+            out = sys.stdout.buffer
+            for chunk in chunks:
+                out.write(chunk)
+            out.flush()
+            return
+
+        written = 0
+        with open(options['output'], 'wb') as out:
+            for chunk in chunks:
+                out.write(chunk)
+                written += len(chunk)
+        self.stderr.write(self.style.SUCCESS(f"Wrote {written} bytes to {options['output']}"))
@@ -0,0 +1,31 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from api import transfer
+
+
+class Command(BaseCommand):
+    help = "Import conversations from a records-layout NDJSON export (plain or gzipped)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="NDJSON file written by export_conversations")
+        parser.add_argument('--user', required=True, help="Username that will own the imported conversations")
+        parser.add_argument('--batch-size', type=int, default=transfer.DEFAULT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"User '{options['user']}' does not exist")
+
+        try:
+            with open(options['path'], 'rb') as f:
+                conversations, messages = transfer.import_records(
+                    transfer.open_ndjson(f), user, batch_size=options['batch_size']
+                )
+        except (ValueError, OSError, EOFError) as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {conversations} conversations and {messages} messages for {user.username}"
+        ))
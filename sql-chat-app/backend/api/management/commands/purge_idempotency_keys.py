@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from api import idempotency
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete stored chat Idempotency-Key results older than CHAT_IDEMPOTENCY_TTL_SECONDS "
+        "and in-flight keys abandoned for longer than CHAT_IDEMPOTENCY_LEASE_SECONDS."
+    )
+
+    def handle(self, *args, **options):
+        deleted = idempotency.purge_expired()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired idempotency records"))
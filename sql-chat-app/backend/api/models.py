@@ -6,12 +6,24 @@ class Conversation(models.Model):
     title = models.CharField(max_length=255, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Set when the messages have been moved to ConversationArchive.
+    is_archived = models.BooleanField(default=False)
 
     def __str__(self):
         return f"{self.user.username} - {self.title or 'Untitled Chat'}"
 
     class Meta:
         ordering = ['-updated_at']
+        indexes = [
+            models.Index(fields=['is_archived', 'updated_at'], name='api_conv_archived_upd_idx'),
+        ]
+
+# First line of the reply ChatView saves when the model call fails (see
+# generate_fallback_response); used to keep those replies out of dataset exports.
+FALLBACK_RESPONSE_INTRO = (
+    "The conversational model is not loaded right now, but I'm still here to help. "
+    "Here's a structured reply you can use:"
+)
 
 class Message(models.Model):
     ROLE_CHOICES = (
@@ -29,3 +41,39 @@ class Message(models.Model):
 
     class Meta:
         ordering = ['created_at']
+
+
+class ConversationArchive(models.Model):
+    """Cold storage for the messages of an inactive conversation."""
+    conversation = models.OneToOneField(Conversation, on_delete=models.CASCADE, related_name='archive')
+    # zstd-compressed JSON list of [role, content, created_at] rows
+    payload = models.BinaryField()
+    message_count = models.PositiveIntegerField()
+    raw_size = models.PositiveIntegerField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Archive of {self.conversation_id} ({self.message_count} messages)"
+
+
+class IdempotencyRecord(models.Model):
+    """Result of a chat submission, keyed by the client's Idempotency-Key header."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='idempotency_records')
+    key = models.CharField(max_length=255)
+    # Fingerprint of the request body; a reused key with a different body is rejected.
+    request_hash = models.CharField(max_length=64)
+    # Null while the first request is still in flight.
+    response = models.JSONField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.user_id}:{self.key}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='api_idempotency_user_key_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['created_at'], name='api_idempotency_created_idx'),
+        ]
@@ -0,0 +1,206 @@
+# api/retention.py
+"""
+Cold-data retention for conversations.
+
+Conversations that have not been touched for ``CONVERSATION_ARCHIVE_AFTER_DAYS``
+have their messages packed into a single zstd-compressed ``ConversationArchive``
+row and removed from the hot ``Message`` table. The ``Conversation`` row stays
+behind as a lightweight stub (``is_archived=True``) so it still shows up in the
+sidebar; opening it rehydrates the messages transparently.
+
+Each conversation is archived in its own short transaction, so the batch job
+never holds locks for longer than it takes to move one conversation.
+"""
+
+import json
+from datetime import timedelta
+
+import zstandard
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import Length
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .bulk import restore_timestamps
+from .models import Conversation, ConversationArchive, Message
+
+
+def encode_messages(rows, level=None):
+    """Compress ``(role, content, created_at)`` rows. Returns ``(payload, raw_size)``."""
+    level = settings.CONVERSATION_ARCHIVE_ZSTD_LEVEL if level is None else level
+    raw = json.dumps(
+        [[role, content, created_at.isoformat()] for role, content, created_at in rows],
+        ensure_ascii=False,
+    ).encode('utf-8')
+    return zstandard.ZstdCompressor(level=level).compress(raw), len(raw)
+
+
+def decode_messages(payload):
+    """Inverse of ``encode_messages``: yield ``(role, content, created_at)``."""
+    raw = zstandard.ZstdDecompressor().decompress(bytes(payload))
+    for role, content, created_at in json.loads(raw):
+        yield role, content, parse_datetime(created_at)
+
+
+def iter_archived_messages(conversations, chunk_size=100):
+    """Yield ``(conversation_id, role, content, created_at)`` for archived conversations."""
+    archives = (
+        ConversationArchive.objects.filter(conversation__in=conversations)
+        .order_by('conversation_id')
+        .values_list('conversation_id', 'payload')
+    )
+    for conv_id, payload in archives.iterator(chunk_size=chunk_size):
+        for role, content, created_at in decode_messages(payload):
+            yield conv_id, role, content, created_at
+
+
+def archive_conversation(conversation_id, cutoff=None, level=None):
+    """
+    Move the messages of one conversation into its archive row.
+
+    Returns ``(message_count, raw_size, compressed_size)``, or None when the
+    conversation is locked, already archived, was touched after ``cutoff`` or
+    has no messages.
+    """
+    with transaction.atomic():
+        conversations = Conversation.objects.select_for_update(skip_locked=True).filter(
+            pk=conversation_id, is_archived=False
+        )
+        if cutoff is not None:
+            conversations = conversations.filter(updated_at__lt=cutoff)
+        conversation = conversations.first()
+        if conversation is None:
+            return None
+
+        rows = list(
+            Message.objects.filter(conversation_id=conversation.pk)
+            .order_by('created_at', 'id')
+            .values_list('id', 'role', 'content', 'created_at')
+        )
+        if not rows:
+            return None
+
+        payload, raw_size = encode_messages([row[1:] for row in rows], level)
+        ConversationArchive.objects.create(
+            conversation=conversation,
+            payload=payload,
+            message_count=len(rows),
+            raw_size=raw_size,
+        )
+        # Only delete what was packed; a message posted meanwhile has a higher id
+        # and stays hot until the conversation is rehydrated.
+        Message.objects.filter(
+            conversation_id=conversation.pk, id__lte=max(row[0] for row in rows)
+        ).delete()
+        # update() so auto_now does not bump updated_at
+        Conversation.objects.filter(pk=conversation.pk).update(is_archived=True)
+
+    return len(rows), raw_size, len(payload)
+
+
+def rehydrate_conversation(conversation):
+    """Move archived messages back into the hot table. Returns the number restored."""
+    if not conversation.is_archived:
+        return 0
+
+    restored = 0
+    with transaction.atomic():
+        archive = ConversationArchive.objects.select_for_update().filter(conversation=conversation).first()
+        if archive is not None:
+            decoded = list(decode_messages(archive.payload))
+            messages = [
+                Message(conversation=conversation, role=role, content=content)
+                for role, content, _ in decoded
+            ]
+            Message.objects.bulk_create(messages)
+            restore_timestamps(Message, messages, [(created_at,) for _, _, created_at in decoded], ['created_at'])
+            archive.delete()
+            restored = len(messages)
+        Conversation.objects.filter(pk=conversation.pk).update(is_archived=False)
+
+    conversation.is_archived = False
+    return restored
+
+
+def archivable_conversations(cutoff):
+    return Conversation.objects.filter(is_archived=False, updated_at__lt=cutoff)
+
+
+def archive_inactive(days=None, batch_size=None, max_batches=None, level=None):
+    """
+    Archive every conversation inactive for more than ``days``, walking the
+    candidates in primary-key batches. Returns totals for the run.
+    """
+    days = settings.CONVERSATION_ARCHIVE_AFTER_DAYS if days is None else days
+    batch_size = batch_size or settings.CONVERSATION_ARCHIVE_BATCH_SIZE
+    cutoff = timezone.now() - timedelta(days=days)
+
+    totals = {'conversations': 0, 'messages': 0, 'raw_bytes': 0, 'compressed_bytes': 0, 'batches': 0}
+    last_id = 0
+    while max_batches is None or totals['batches'] < max_batches:
+        ids = list(
+            archivable_conversations(cutoff)
+            .filter(id__gt=last_id)
+            .order_by('id')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            break
+        totals['batches'] += 1
+        last_id = ids[-1]
+
+        for conversation_id in ids:
+            result = archive_conversation(conversation_id, cutoff=cutoff, level=level)
+            if result is None:
+                continue
+            messages, raw_size, compressed_size = result
+            totals['conversations'] += 1
+            totals['messages'] += messages
+            totals['raw_bytes'] += raw_size
+            totals['compressed_bytes'] += compressed_size
+
+    return totals
+
+
+def table_bytes(model):
+    """On-disk size of ``model``'s table including indexes, or None if unknown."""
+    table = model._meta.db_table
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute("SELECT pg_total_relation_size(%s)", [table])
+            elif connection.vendor == 'sqlite':
+                # Needs SQLite built with the dbstat virtual table.
+                cursor.execute(
+                    "SELECT SUM(pgsize) FROM dbstat "
+                    "WHERE name IN (SELECT name FROM sqlite_master WHERE tbl_name = %s)",
+                    [table],
+                )
+            else:
+                return None
+            row = cursor.fetchone()
+    except DatabaseError:
+        return None
+    return row[0] if row else None
+
+
+def hot_table_report():
+    """Row counts and sizes of the hot and archive tables."""
+    archives = ConversationArchive.objects.aggregate(
+        rows=Count('id'),
+        messages=Sum('message_count'),
+        raw_bytes=Sum('raw_size'),
+        compressed_bytes=Sum(Length('payload')),
+    )
+    return {
+        'hot_messages': Message.objects.count(),
+        'conversations': Conversation.objects.count(),
+        'archived_conversations': Conversation.objects.filter(is_archived=True).count(),
+        'archived_messages': archives['messages'] or 0,
+        'archive_raw_bytes': archives['raw_bytes'] or 0,
+        'archive_compressed_bytes': archives['compressed_bytes'] or 0,
+        'message_table_bytes': table_bytes(Message),
+        'archive_table_bytes': table_bytes(ConversationArchive),
+    }
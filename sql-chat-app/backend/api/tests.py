@@ -1,3 +1,548 @@
-from django.test import TestCase
+import io
+import json
+import threading
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db import IntegrityError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from . import domain_gate, idempotency, retention, transfer
+from .models import Conversation, ConversationArchive, IdempotencyRecord, Message
+from .views import generate_fallback_response
+
+
+def at(day, hour=12):
+    return datetime(2024, 1, day, hour, tzinfo=dt_timezone.utc)
+
+
+def make_conversation(user, title, messages, created_at=None, updated_at=None):
+    """Create a conversation with ``(role, content, created_at)`` messages and fixed timestamps."""
+    conversation = Conversation.objects.create(user=user, title=title)
+    for role, content, created_at_msg in messages:
+        message = Message.objects.create(conversation=conversation, role=role, content=content)
+        Message.objects.filter(pk=message.pk).update(created_at=created_at_msg)
+    Conversation.objects.filter(pk=conversation.pk).update(
+        created_at=created_at or at(1), updated_at=updated_at or at(2)
+    )
+    conversation.refresh_from_db()
+    return conversation
+
+
+def snapshot(user):
+    """Comparable view of a user's conversations and messages."""
+    return [
+        (
+            conversation.title,
+            conversation.created_at,
+            conversation.updated_at,
+            list(conversation.messages.order_by('created_at', 'id').values_list('role', 'content', 'created_at')),
+        )
+        for conversation in Conversation.objects.filter(user=user).order_by('created_at', 'title')
+    ]
+
+
+def ndjson(*records):
+    return io.StringIO(''.join(json.dumps(record) + '\n' for record in records))
+
+
+class TransferTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', password='pw')
+        self.bob = User.objects.create_user('bob', password='pw')
+        make_conversation(self.alice, 'Joins', [
+            ('user', 'Explain joins', at(1, 9)),
+            ('assistant', 'SELECT * FROM a JOIN b ON a.id = b.a_id;', at(1, 10)),
+            ('user', 'And a left join?', at(1, 11)),
+            ('assistant', 'SELECT * FROM a LEFT JOIN b ON a.id = b.a_id;', at(1, 12)),
+        ], created_at=at(1, 8), updated_at=at(1, 12))
+        make_conversation(self.alice, 'Indexes', [
+            ('user', 'Create an index on email', at(3, 9)),
+            ('assistant', 'CREATE INDEX users_email_idx ON users (email);', at(3, 10)),
+        ], created_at=at(3, 8), updated_at=at(3, 10))
+
+    def export(self, user, **kwargs):
+        compress = kwargs.pop('compress', False)
+        return b''.join(transfer.iter_ndjson(transfer.iter_export(user, **kwargs), compress=compress))
+
+    def test_records_round_trip(self):
+        data = self.export(self.alice)
+        counts = transfer.import_records(transfer.open_ndjson(io.BytesIO(data)), self.bob, batch_size=2)
+
+        self.assertEqual(counts, (2, 6))
+        self.assertEqual(snapshot(self.bob), snapshot(self.alice))
+
+    def test_gzip_round_trip(self):
+        data = self.export(self.alice, compress=True)
+        self.assertEqual(data[:2], b'\x1f\x8b')
+
+        transfer.import_records(transfer.open_ndjson(io.BytesIO(data)), self.bob)
+        self.assertEqual(snapshot(self.bob), snapshot(self.alice))
+
+    def test_dataset_layout_pairs_prompts_with_replies(self):
+        rows = [json.loads(line) for line in self.export(self.alice, layout='dataset').splitlines()]
+        self.assertEqual([row['prompt'] for row in rows], [
+            'Explain joins', 'And a left join?', 'Create an index on email',
+        ])
+        self.assertEqual(rows[2]['completion'], 'CREATE INDEX users_email_idx ON users (email);')
+
+    def test_dataset_layout_skips_fallback_replies(self):
+        conversation = Conversation.objects.get(user=self.alice, title='Indexes')
+        Message.objects.create(conversation=conversation, role='user', content='Drop the index')
+        Message.objects.create(
+            conversation=conversation, role='assistant', content=generate_fallback_response('Drop the index')
+        )
+
+        rows = [json.loads(line) for line in self.export(self.alice, layout='dataset').splitlines()]
+
+        self.assertNotIn('Drop the index', [row['prompt'] for row in rows])
+        self.assertEqual(len(rows), 3)
+
+    def test_malformed_fields_raise_transfer_error(self):
+        conversation = {'type': 'conversation', 'id': 1, 'title': 'ok'}
+        cases = {
+            'title': {**conversation, 'title': 5},
+            'created_at type': {**conversation, 'created_at': 20240101},
+            'created_at value': {**conversation, 'created_at': 'yesterday'},
+            'id': {**conversation, 'id': [1]},
+        }
+        for name, record in cases.items():
+            with self.subTest(name):
+                with self.assertRaises(transfer.TransferError):
+                    transfer.import_records(ndjson(record), self.bob)
+
+        messages = {
+            'role': {'type': 'message', 'conversation': 1, 'role': ['user'], 'content': 'hi'},
+            'content': {'type': 'message', 'conversation': 1, 'role': 'user', 'content': None},
+            'conversation': {'type': 'message', 'conversation': {'id': 1}, 'role': 'user', 'content': 'hi'},
+        }
+        for name, record in messages.items():
+            with self.subTest(name):
+                with self.assertRaises(transfer.TransferError):
+                    transfer.import_records(ndjson(conversation, record), self.bob)
+
+    def test_failed_import_keeps_committed_batches(self):
+        lines = ndjson(
+            {'type': 'conversation', 'id': 1, 'title': 'first'},
+            {'type': 'conversation', 'id': 2, 'title': 'second'},
+            {'type': 'conversation', 'id': 3, 'title': 'pending'},
+            {'type': 'bogus'},
+        )
+        with self.assertRaisesRegex(transfer.TransferError, r"Line 4: .*\(2 conversations and 0 messages"):
+            transfer.import_records(lines, self.bob, batch_size=2)
+
+        titles = Conversation.objects.filter(user=self.bob).order_by('id').values_list('title', flat=True)
+        self.assertEqual(list(titles), ['first', 'second'])
+
+    def test_import_endpoint_rejects_malformed_file(self):
+        client = APIClient()
+        client.force_authenticate(self.bob)
+        upload = SimpleUploadedFile(
+            'export.jsonl', b'{"type": "conversation", "id": 1, "title": 7}\n', content_type='application/x-ndjson'
+        )
+
+        response = client.post('/api/conversations/import/', {'file': upload}, format='multipart')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("'title' must be a string", response.data['error'])
+
+    def test_export_endpoint_round_trips_through_import_endpoint(self):
+        client = APIClient()
+        client.force_authenticate(self.alice)
+        exported = client.get('/api/conversations/export/', {'compress': 'gzip'})
+        self.assertEqual(exported.status_code, 200)
+        data = b''.join(exported.streaming_content)
+
+        client.force_authenticate(self.bob)
+        upload = SimpleUploadedFile('export.jsonl.gz', data, content_type='application/gzip')
+        response = client.post('/api/conversations/import/', {'file': upload}, format='multipart')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data, {'conversations': 2, 'messages': 6})
+        self.assertEqual(snapshot(self.bob), snapshot(self.alice))
+
+
+class RetentionTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', password='pw')
+        self.old = make_conversation(self.alice, 'Old', [
+            ('user', 'List tables', at(1, 9)),
+            ('assistant', "SELECT name FROM sqlite_master WHERE type = 'table';", at(1, 10)),
+        ], created_at=at(1, 8), updated_at=at(1, 10))
+        self.recent = Conversation.objects.create(user=self.alice, title='Recent')
+        Message.objects.create(conversation=self.recent, role='user', content='Count rows')
+        self.old_messages = list(self.old.messages.values_list('role', 'content', 'created_at'))
+
+    def test_archive_and_rehydrate_round_trip(self):
+        totals = retention.archive_inactive(days=30)
+
+        self.assertEqual(totals['conversations'], 1)
+        self.assertEqual(totals['messages'], 2)
+        self.old.refresh_from_db()
+        self.recent.refresh_from_db()
+        self.assertTrue(self.old.is_archived)
+        self.assertFalse(self.recent.is_archived)
+        self.assertFalse(self.old.messages.exists())
+        self.assertEqual(self.old.archive.message_count, 2)
+        # Archiving must not count as activity.
+        self.assertEqual(self.old.updated_at, at(1, 10))
+
+        self.assertEqual(retention.rehydrate_conversation(self.old), 2)
+        self.old.refresh_from_db()
+        self.assertFalse(self.old.is_archived)
+        self.assertFalse(ConversationArchive.objects.exists())
+        self.assertEqual(list(self.old.messages.values_list('role', 'content', 'created_at')), self.old_messages)
+
+    def test_archive_skips_conversations_touched_after_cutoff(self):
+        cutoff = timezone.now() - timedelta(days=30)
+        self.assertIsNone(retention.archive_conversation(self.recent.pk, cutoff=cutoff))
+        self.assertIsNotNone(retention.archive_conversation(self.old.pk, cutoff=cutoff))
+        self.assertIsNone(retention.archive_conversation(self.old.pk, cutoff=cutoff))
+
+    def test_message_posted_while_archiving_stays_hot(self):
+        encode = retention.encode_messages
+
+        def encode_then_post(rows, level=None):
+            # A chat reply lands after the rows were read but before they are deleted.
+            Message.objects.create(conversation=self.old, role='user', content='One more question')
+            return encode(rows, level)
+
+        with mock.patch.object(retention, 'encode_messages', side_effect=encode_then_post):
+            messages, _, _ = retention.archive_conversation(self.old.pk)
+
+        self.assertEqual(messages, 2)
+        self.assertEqual(list(self.old.messages.values_list('content', flat=True)), ['One more question'])
+
+        retention.rehydrate_conversation(Conversation.objects.get(pk=self.old.pk))
+        self.assertEqual(
+            list(self.old.messages.order_by('created_at').values_list('content', flat=True)),
+            [content for _, content, _ in self.old_messages] + ['One more question'],
+        )
+
+    def test_export_includes_archived_messages(self):
+        before = list(transfer.iter_records(self.alice))
+        retention.archive_inactive(days=30)
+        after = list(transfer.iter_records(self.alice))
+
+        self.assertCountEqual(
+            [json.dumps(record, sort_keys=True) for record in after],
+            [json.dumps(record, sort_keys=True) for record in before],
+        )
+        self.assertTrue(Conversation.objects.get(pk=self.old.pk).is_archived)
+
+    def test_retrieve_rehydrates_archived_conversation(self):
+        retention.archive_inactive(days=30)
+        client = APIClient()
+        client.force_authenticate(self.alice)
+
+        response = client.get(f'/api/conversations/{self.old.pk}/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([m['content'] for m in response.data['messages']], [c for _, c, _ in self.old_messages])
+        self.assertFalse(Conversation.objects.get(pk=self.old.pk).is_archived)
+
+
+class SingleFlightTests(TestCase):
+    def setUp(self):
+        # Signals once a caller blocks on an in-flight call, so the tests do
+        # not depend on sleeps to order the threads.
+        self.waiting = waiting = threading.Event()
+
+        class ObservedEvent(threading.Event):
+            def wait(self, timeout=None):
+                waiting.set()
+                return super().wait(timeout)
+
+        class ObservedCall(idempotency._Call):
+            def __init__(self):
+                super().__init__()
+                self.done = ObservedEvent()
+
+        patcher = mock.patch.object(idempotency, '_Call', ObservedCall)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_pair(self, flight, fn, release, started):
+        """Run a leader and a follower on the same key; return their outcomes."""
+        outcomes = []
+
+        def run():
+            try:
+                outcomes.append(flight.do('key', fn))
+            except RuntimeError as e:
+                outcomes.append(str(e))
+
+        leader = threading.Thread(target=run)
+        leader.start()
+        self.assertTrue(started.wait(5))
+        follower = threading.Thread(target=run)
+        follower.start()
+        self.assertTrue(self.waiting.wait(5))
+        release.set()
+        leader.join(5)
+        follower.join(5)
+        return outcomes
+
+    def test_concurrent_callers_share_one_call(self):
+        flight = idempotency.SingleFlight()
+        started, release = threading.Event(), threading.Event()
+        calls = []
+
+        def slow_call():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return 'result'
+
+        outcomes = self.run_pair(flight, slow_call, release, started)
+
+        self.assertEqual(len(calls), 1)
+        self.assertCountEqual(outcomes, [('result', False), ('result', True)])
+        # Finished calls are forgotten, so the next one runs again.
+        self.assertEqual(flight.do('key', lambda: 'again'), ('again', False))
+
+    def test_leader_error_is_raised_in_waiters(self):
+        flight = idempotency.SingleFlight()
+        started, release = threading.Event(), threading.Event()
+
+        def failing_call():
+            started.set()
+            release.wait(5)
+            raise RuntimeError('model down')
+
+        outcomes = self.run_pair(flight, failing_call, release, started)
+
+        self.assertEqual(outcomes, ['model down', 'model down'])
+
+
+class IdempotencyRecordTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', password='pw')
+
+    def age(self, record, seconds):
+        IdempotencyRecord.objects.filter(pk=record.pk).update(
+            created_at=timezone.now() - timedelta(seconds=seconds)
+        )
+
+    def test_claim_complete_release(self):
+        record, created = idempotency.claim(self.alice, 'k1', 'hash')
+        self.assertTrue(created)
+        self.assertFalse(idempotency.claim(self.alice, 'k1', 'hash')[1])
+
+        idempotency.complete(record, {'response': 'ok'})
+        stored, created = idempotency.claim(self.alice, 'k1', 'hash')
+        self.assertFalse(created)
+        self.assertEqual(stored.response, {'response': 'ok'})
+
+        # A completed result is kept; only in-flight claims are released.
+        idempotency.release(record)
+        self.assertTrue(IdempotencyRecord.objects.filter(pk=record.pk).exists())
+        pending, _ = idempotency.claim(self.alice, 'k2', 'hash')
+        idempotency.release(pending)
+        self.assertFalse(IdempotencyRecord.objects.filter(pk=pending.pk).exists())
+
+    def test_claim_retries_when_owner_releases_during_claim(self):
+        create = IdempotencyRecord.objects.create
+
+        def create_after_release(**kwargs):
+            # First attempt: the key is taken, but the owner releases it before
+            # the conflicting row can be read back.
+            if not attempts:
+                attempts.append(1)
+                raise IntegrityError('duplicate key')
+            return create(**kwargs)
+
+        attempts = []
+        with mock.patch.object(IdempotencyRecord.objects, 'create', side_effect=create_after_release):
+            record, created = idempotency.claim(self.alice, 'k1', 'hash')
+
+        self.assertTrue(created)
+        self.assertEqual(IdempotencyRecord.objects.get().pk, record.pk)
+
+    @override_settings(CHAT_IDEMPOTENCY_LEASE_SECONDS=60, CHAT_IDEMPOTENCY_TTL_SECONDS=3600)
+    def test_abandoned_claim_is_taken_over_after_lease(self):
+        abandoned, _ = idempotency.claim(self.alice, 'k1', 'hash')
+        self.age(abandoned, 30)
+        self.assertFalse(idempotency.claim(self.alice, 'k1', 'hash')[1])
+
+        self.age(abandoned, 61)
+        retry, created = idempotency.claim(self.alice, 'k1', 'hash')
+        self.assertTrue(created)
+        self.assertNotEqual(retry.pk, abandoned.pk)
+
+        # The original finishing late must not fail or clobber the retry.
+        idempotency.complete(abandoned, {'response': 'late'})
+        retry.refresh_from_db()
+        self.assertIsNone(retry.response)
+
+    @override_settings(CHAT_IDEMPOTENCY_LEASE_SECONDS=60, CHAT_IDEMPOTENCY_TTL_SECONDS=3600)
+    def test_completed_result_lives_for_the_ttl(self):
+        record, _ = idempotency.claim(self.alice, 'k1', 'hash')
+        idempotency.complete(record, {'response': 'ok'})
+        self.age(record, 600)
+        self.assertFalse(idempotency.claim(self.alice, 'k1', 'hash')[1])
+
+        self.age(record, 3601)
+        self.assertTrue(idempotency.claim(self.alice, 'k1', 'hash')[1])
+
+    @override_settings(CHAT_IDEMPOTENCY_LEASE_SECONDS=60, CHAT_IDEMPOTENCY_TTL_SECONDS=3600)
+    def test_purge_expired(self):
+        fresh, _ = idempotency.claim(self.alice, 'fresh', 'hash')
+        abandoned, _ = idempotency.claim(self.alice, 'abandoned', 'hash')
+        self.age(abandoned, 61)
+        done, _ = idempotency.claim(self.alice, 'done', 'hash')
+        idempotency.complete(done, {'response': 'ok'})
+        self.age(done, 600)
+        expired, _ = idempotency.claim(self.alice, 'expired', 'hash')
+        idempotency.complete(expired, {'response': 'ok'})
+        self.age(expired, 3601)
+
+        self.assertEqual(idempotency.purge_expired(), 2)
+        self.assertCountEqual(IdempotencyRecord.objects.values_list('key', flat=True), ['fresh', 'done'])
+
+
+@mock.patch('api.domain_gate.is_on_topic', return_value=True)
+@mock.patch('api.views.generate_model_response', return_value='SELECT 1;')
+class ChatIdempotencyTests(TestCase):
+    message = 'Select the number one'
+
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def post(self, key, message=None):
+        return self.client.post(
+            '/api/chat/', {'message': message or self.message}, format='json', HTTP_IDEMPOTENCY_KEY=key
+        )
+
+    def test_same_key_replays_stored_response(self, model, _):
+        first = self.post('k1')
+        second = self.post('k1')
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(model.call_count, 1)
+        self.assertEqual(Message.objects.count(), 2)
+
+    def test_overlong_key_is_rejected(self, model, _):
+        response = self.post('k' * (idempotency.MAX_KEY_LENGTH + 1))
+
+        self.assertEqual(response.status_code, 400)
+        model.assert_not_called()
+        self.assertFalse(IdempotencyRecord.objects.exists())
+
+    def test_reused_key_with_different_body_is_rejected(self, model, _):
+        self.post('k1')
+        response = self.post('k1', message='Select the number two')
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(model.call_count, 1)
+
+    @override_settings(CHAT_IDEMPOTENCY_WAIT_SECONDS=0)
+    def test_in_flight_key_times_out_with_409(self, model, _):
+        idempotency.claim(self.alice, 'k1', idempotency.request_fingerprint(None, self.message))
+
+        response = self.post('k1')
+
+        self.assertEqual(response.status_code, 409)
+        model.assert_not_called()
+
+    @override_settings(CHAT_IDEMPOTENCY_LEASE_SECONDS=60)
+    def test_abandoned_key_is_retried(self, model, _):
+        record, _ = idempotency.claim(self.alice, 'k1', idempotency.request_fingerprint(None, self.message))
+        IdempotencyRecord.objects.filter(pk=record.pk).update(created_at=timezone.now() - timedelta(seconds=61))
+
+        response = self.post('k1')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(model.call_count, 1)
+        self.assertEqual(IdempotencyRecord.objects.get(key='k1').response, response.data)
+
+    def test_failed_submission_releases_key(self, model, _):
+        with mock.patch('api.views.ChatView.submit', side_effect=RuntimeError('db down')):
+            self.assertEqual(self.post('k1').status_code, 500)
+        self.assertFalse(IdempotencyRecord.objects.exists())
+
+        self.assertEqual(self.post('k1').status_code, 200)
+
+    def test_reserved_key_prefix_is_rejected(self, model, _):
+        response = self.post(idempotency.COALESCE_KEY_PREFIX + 'k1')
+
+        self.assertEqual(response.status_code, 400)
+        model.assert_not_called()
+
+    def post_without_key(self):
+        return self.client.post('/api/chat/', {'message': self.message}, format='json')
+
+    def coalesce_key(self):
+        return idempotency.COALESCE_KEY_PREFIX + idempotency.request_fingerprint(self.alice.id, '', self.message)
+
+    def test_duplicate_without_key_shares_result_across_workers(self, model, _):
+        # Sequential requests never meet in SingleFlight, so only the database
+        # record can coalesce them, as it does for requests on other workers.
+        first = self.post_without_key()
+        second = self.post_without_key()
+
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(model.call_count, 1)
+        self.assertEqual(Message.objects.count(), 2)
+
+    @override_settings(CHAT_COALESCE_WINDOW_SECONDS=5)
+    def test_duplicate_without_key_after_window_calls_model_again(self, model, _):
+        self.post_without_key()
+        IdempotencyRecord.objects.filter(key=self.coalesce_key()).update(
+            completed_at=timezone.now() - timedelta(seconds=6)
+        )
+
+        self.assertEqual(self.post_without_key().status_code, 200)
+        self.assertEqual(model.call_count, 2)
+        self.assertEqual(Message.objects.count(), 4)
+
+    @override_settings(CHAT_IDEMPOTENCY_WAIT_SECONDS=0)
+    def test_duplicate_without_key_runs_itself_when_original_is_still_running(self, model, _):
+        fingerprint = idempotency.request_fingerprint(self.alice.id, '', self.message)
+        idempotency.claim(self.alice, idempotency.COALESCE_KEY_PREFIX + fingerprint, fingerprint)
+
+        response = self.post_without_key()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(model.call_count, 1)
+
+
+@mock.patch('api.views.generate_model_response', return_value='SELECT 1;')
+class DomainGateTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def test_classifier_separates_database_questions(self, _):
+        self.assertTrue(domain_gate.is_on_topic('Write a SQL query to list all users older than 30'))
+        self.assertFalse(domain_gate.is_on_topic('What is the capital of France?'))
+
+    def test_off_topic_opening_message_is_refused_without_model_call(self, model):
+        response = self.client.post('/api/chat/', {'message': 'What is the capital of France?'}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['response'], domain_gate.REFUSAL_MESSAGE)
+        model.assert_not_called()
+
+    def test_follow_up_in_existing_conversation_is_not_gated(self, model):
+        first = self.client.post('/api/chat/', {'message': 'List all tables in my database'}, format='json')
+        follow_up = self.client.post(
+            '/api/chat/',
+            {'message': 'what about for postgres?', 'conversation_id': first.data['conversation_id']},
+            format='json',
+        )
+
+        self.assertEqual(follow_up.status_code, 200)
+        self.assertEqual(follow_up.data['response'], 'SELECT 1;')
+        self.assertEqual(model.call_count, 2)
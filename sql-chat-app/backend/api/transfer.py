@@ -0,0 +1,280 @@
+# api/transfer.py
+"""
+Bulk export and import of conversations as NDJSON.
+
+Exports stream straight from the database with ``.iterator()`` so memory stays
+flat no matter how long a user's history is. Two layouts are supported:
+
+- ``records``: one ``conversation`` line per conversation followed by one
+  ``message`` line per message. This is the backup / migration format and is
+  what ``import_records`` reads back.
+- ``dataset``: ``{"prompt": ..., "completion": ...}`` rows pairing each user
+  message with the assistant reply that follows it, i.e. the same shape as
+  ``dataset.jsonl`` used for fine-tuning.
+"""
+
+import gzip
+import io
+import itertools
+import json
+import zlib
+
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+
+from .bulk import restore_timestamps
+from .models import FALLBACK_RESPONSE_INTRO, Conversation, Message
+from .retention import iter_archived_messages
+
+EXPORT_LAYOUTS = ('records', 'dataset')
+DEFAULT_CHUNK_SIZE = 2000
+DEFAULT_BATCH_SIZE = 500
+
+# Flush roughly this many bytes per yielded chunk.
+STREAM_BUFFER_SIZE = 64 * 1024
+
+
+class TransferError(ValueError):
+    """Raised when an NDJSON import contains an invalid line."""
+
+
+def _owned_conversations(user):
+    conversations = Conversation.objects.all()
+    if user is not None:
+        conversations = conversations.filter(user=user)
+    return conversations
+
+
+def _iter_messages(user, chunk_size):
+    """Hot messages followed by the contents of archived conversations."""
+    hot = (
+        Message.objects.filter(conversation__in=_owned_conversations(user))
+        .order_by('conversation_id', 'created_at', 'id')
+        .values_list('conversation_id', 'role', 'content', 'created_at')
+        .iterator(chunk_size=chunk_size)
+    )
+    archived = iter_archived_messages(_owned_conversations(user).filter(is_archived=True))
+    return itertools.chain(hot, archived)
+
+
+def iter_records(user=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield backup records for ``user`` (or everyone when ``user`` is None)."""
+    conversations = (
+        _owned_conversations(user)
+        .order_by('id')
+        .values_list('id', 'user__username', 'title', 'created_at', 'updated_at')
+    )
+    for conv_id, username, title, created_at, updated_at in conversations.iterator(chunk_size=chunk_size):
+        yield {
+            'type': 'conversation',
+            'id': conv_id,
+            'user': username,
+            'title': title,
+            'created_at': created_at.isoformat(),
+            'updated_at': updated_at.isoformat(),
+        }
+
+    for conv_id, role, content, created_at in _iter_messages(user, chunk_size):
+        yield {
+            'type': 'message',
+            'conversation': conv_id,
+            'role': role,
+            'content': content,
+            'created_at': created_at.isoformat(),
+        }
+
+
+def iter_dataset_rows(user=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yield ``{"prompt", "completion"}`` pairs in ``dataset.jsonl`` format.
+
+    Prompts answered with the fallback template (the model call failed) are
+    skipped, so outage replies never end up in fine-tuning data.
+    """
+    pending = None
+    for conv_id, role, content, _ in _iter_messages(user, chunk_size):
+        if role == 'user':
+            pending = (conv_id, content)
+        elif pending and pending[0] == conv_id:
+            if not content.startswith(FALLBACK_RESPONSE_INTRO):
+                yield {'prompt': pending[1], 'completion': content}
+            pending = None
+
+
+def iter_export(user=None, layout='records', chunk_size=DEFAULT_CHUNK_SIZE):
+    if layout not in EXPORT_LAYOUTS:
+        raise ValueError(f"Unknown export layout '{layout}'. Choose one of: {', '.join(EXPORT_LAYOUTS)}")
+    if layout == 'dataset':
+        return iter_dataset_rows(user, chunk_size)
+    return iter_records(user, chunk_size)
+
+
+def iter_ndjson(rows, compress=False):
+    """
+    Serialize ``rows`` as NDJSON and yield byte chunks of ~64 KiB, gzip
+    compressed on the fly when ``compress`` is set.
+    """
+    compressor = zlib.compressobj(wbits=31) if compress else None  # 31 => gzip container
+    buffer = []
+    size = 0
+
+    for row in rows:
+        line = (json.dumps(row, ensure_ascii=False) + '\n').encode('utf-8')
+        buffer.append(line)
+        size += len(line)
+        if size >= STREAM_BUFFER_SIZE:
+            chunk = b''.join(buffer)
+            buffer, size = [], 0
+            if compressor:
+                chunk = compressor.compress(chunk)
+            if chunk:
+                yield chunk
+
+    chunk = b''.join(buffer)
+    if compressor:
+        chunk = compressor.compress(chunk) + compressor.flush()
+    if chunk:
+        yield chunk
+
+
+def open_ndjson(fileobj):
+    """Wrap a seekable binary file object as text, transparently un-gzipping it."""
+    magic = fileobj.read(2)
+    fileobj.seek(0)
+    if magic == b'\x1f\x8b':
+        fileobj = gzip.GzipFile(fileobj=fileobj)
+    return io.TextIOWrapper(fileobj, encoding='utf-8')
+
+
+def _parse_lines(lines):
+    for lineno, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise TransferError(f"Line {lineno}: invalid JSON ({e.msg})")
+        if not isinstance(record, dict):
+            raise TransferError(f"Line {lineno}: expected a JSON object")
+        yield lineno, record
+
+
+def _string(record, field, lineno):
+    value = record.get(field)
+    if value is not None and not isinstance(value, str):
+        raise TransferError(f"Line {lineno}: '{field}' must be a string")
+    return value
+
+
+def _timestamp(record, field, lineno):
+    value = _string(record, field, lineno)
+    if not value:
+        return None
+    try:
+        parsed = parse_datetime(value)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise TransferError(f"Line {lineno}: '{field}' is not an ISO 8601 datetime")
+    return parsed
+
+
+def _record_key(value):
+    """Conversation ids are ints (or strings from other tools); anything else is invalid."""
+    if isinstance(value, (int, str)) and not isinstance(value, bool):
+        return value
+    return None
+
+
+def _flush_messages(batch, stamps):
+    if not batch:
+        return 0
+    with transaction.atomic():
+        Message.objects.bulk_create(batch)
+        restore_timestamps(Message, batch, stamps, ['created_at'])
+    return len(batch)
+
+
+def import_records(lines, user, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Import ``records`` layout NDJSON lines for ``user``.
+
+    Conversations get new ids; messages are remapped through the ``id`` of
+    their conversation line, so every conversation line must precede its
+    messages (as ``iter_records`` writes them). Rows are written with batched
+    ``bulk_create``. Returns ``(conversations, messages)`` counts.
+
+    Each batch commits in its own transaction, so a large upload never holds
+    the write lock (database-wide on SQLite) for longer than one batch. The
+    trade-off is that an import failing at line N keeps the batches written
+    before it; the ``TransferError`` says how many rows that was. Since
+    bulk_create cannot write ``auto_now`` / ``auto_now_add`` values, each
+    batch is followed by a ``bulk_update`` of just its timestamp columns.
+    """
+    conv_count = message_count = 0
+    try:
+        for conversations, messages in _import_batches(lines, user, batch_size):
+            conv_count += conversations
+            message_count += messages
+    except TransferError as e:
+        raise TransferError(
+            f"{e} ({conv_count} conversations and {message_count} messages before it were imported)"
+        ) from e
+    return conv_count, message_count
+
+
+def _import_batches(lines, user, batch_size):
+    """Write ``lines`` batch by batch, yielding ``(conversations, messages)`` written."""
+    conversation_ids = {}
+    pending_convs, pending_conv_keys, pending_conv_stamps = [], [], []
+    messages, message_stamps = [], []
+
+    def flush_conversations():
+        if not pending_convs:
+            return 0
+        with transaction.atomic():
+            Conversation.objects.bulk_create(pending_convs)
+            restore_timestamps(Conversation, pending_convs, pending_conv_stamps, ['created_at', 'updated_at'])
+        for key, conv in zip(pending_conv_keys, pending_convs):
+            conversation_ids[key] = conv.id
+        flushed = len(pending_convs)
+        pending_convs.clear()
+        pending_conv_keys.clear()
+        pending_conv_stamps.clear()
+        return flushed
+
+    for lineno, record in _parse_lines(lines):
+        kind = record.get('type')
+        if kind == 'conversation':
+            key = _record_key(record.get('id'))
+            if key is None:
+                raise TransferError(f"Line {lineno}: conversation needs an integer or string 'id'")
+            title = _string(record, 'title', lineno)
+            stamps = (_timestamp(record, 'created_at', lineno), _timestamp(record, 'updated_at', lineno))
+            pending_convs.append(Conversation(user=user, title=(title or '')[:255] or None))
+            pending_conv_keys.append(key)
+            pending_conv_stamps.append(stamps)
+            if len(pending_convs) >= batch_size:
+                yield flush_conversations(), 0
+        elif kind == 'message':
+            key = _record_key(record.get('conversation'))
+            if key is not None and key not in conversation_ids:
+                yield flush_conversations(), 0
+            conv_id = conversation_ids.get(key)
+            if conv_id is None:
+                raise TransferError(f"Line {lineno}: message references unknown conversation")
+            role = record.get('role')
+            if not isinstance(role, str) or role not in dict(Message.ROLE_CHOICES):
+                raise TransferError(f"Line {lineno}: invalid role {role!r}")
+            if not isinstance(record.get('content'), str):
+                raise TransferError(f"Line {lineno}: message content must be a string")
+            messages.append(Message(conversation_id=conv_id, role=role, content=record['content']))
+            message_stamps.append((_timestamp(record, 'created_at', lineno),))
+            if len(messages) >= batch_size:
+                yield 0, _flush_messages(messages, message_stamps)
+                messages, message_stamps = [], []
+        else:
+            raise TransferError(f"Line {lineno}: unknown record type {kind!r}")
+
+    yield flush_conversations(), _flush_messages(messages, message_stamps)
@@ -1,48 +1,25 @@
 # In api/views.py
-import os
 import logging
 import traceback
-from pathlib import Path
 
-from dotenv import load_dotenv
+from django.conf import settings
 from gradio_client import Client
 from rest_framework import status, viewsets, permissions
+from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 
-from .models import Conversation, Message
+from .models import FALLBACK_RESPONSE_INTRO, Conversation, Message
 from .serializers import ConversationSerializer, ConversationDetailSerializer, MessageSerializer
+from . import domain_gate, idempotency, retention, transfer
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-def load_environment():
-    """Load environment variables from .env file if it exists."""
-    possible_paths = [
-        Path(__file__).resolve().parent.parent / '.env',
-        Path(__file__).resolve().parent.parent.parent / '.env',
-        Path('.env'),
-    ]
-
-    for path in possible_paths:
-        if path.exists():
-            load_dotenv(dotenv_path=path, override=True)
-            logger.info(f"Loaded .env file from: {path}")
-            return True
-
-    logger.warning("No .env file found")
-    return False
-
-
-# Load environment variables
-load_environment()
-HF_TOKEN = os.getenv("HF_TOKEN")
-GRADIO_SPACE = os.getenv("GRADIO_SPACE", "saadkhi/SQL_chatbot_API")
-
-
 def get_gradio_client() -> Client:
     """
     Lazily create and cache a Gradio Client for the Talk2DB chatbot Space.
@@ -53,13 +30,13 @@ def get_gradio_client() -> Client:
         return getattr(get_gradio_client, "_client")
 
     try:
-        if HF_TOKEN:
-            client = Client(GRADIO_SPACE, token=HF_TOKEN)
+        if settings.HF_TOKEN:
+            client = Client(settings.GRADIO_SPACE, token=settings.HF_TOKEN)
         else:
-            client = Client(GRADIO_SPACE)
+            client = Client(settings.GRADIO_SPACE)
 
         setattr(get_gradio_client, "_client", client)
-        logger.info(f"Initialized Gradio client for Space: {GRADIO_SPACE}")
+        logger.info(f"Initialized Gradio client for Space: {settings.GRADIO_SPACE}")
         return client
     except Exception as e:
         logger.error(f"Failed to initialize Gradio client: {e}")
@@ -67,6 +44,17 @@ def get_gradio_client() -> Client:
         raise
 
 
+def reset_gradio_client():
+    """
+    Drop the cached Gradio client.
+
+    Called after a gunicorn fork so each worker opens its own HTTP connections
+    instead of sharing sockets inherited from the master.
+    """
+    if hasattr(get_gradio_client, "_client"):
+        delattr(get_gradio_client, "_client")
+
+
 def generate_model_response(user_message: str) -> str:
     """
     Generate a model-backed response by calling the external Gradio Space API.
@@ -84,12 +72,8 @@ def generate_model_response(user_message: str) -> str:
 
 def generate_fallback_response(user_message: str) -> str:
     """Return a helpful fallback response when the model is unavailable."""
-    intro = (
-        "The conversational model is not loaded right now, but I'm still here to help. "
-        "Here's a structured reply you can use:"
-    )
     template = (
-        f"{intro}\n\n"
+        f"{FALLBACK_RESPONSE_INTRO}\n\n"
         "1) I received your request:\n"
         f"   \"{user_message}\"\n\n"
         "2) Suggested next steps:\n"
@@ -116,6 +100,66 @@ class ConversationViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
+    def retrieve(self, request, *args, **kwargs):
+        conversation = self.get_object()
+        # Archived conversations are only stubs; bring their messages back first.
+        retention.rehydrate_conversation(conversation)
+        serializer = self.get_serializer(conversation)
+        return Response(serializer.data)
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Stream the user's conversations as NDJSON.
+
+        Query params: ``layout`` (``records`` or ``dataset``) and
+        ``compress=gzip``.
+        """
+        layout = request.query_params.get('layout', 'records')
+        compress = request.query_params.get('compress') == 'gzip'
+
+        if layout not in transfer.EXPORT_LAYOUTS:
+            return Response(
+                {"error": f"layout must be one of: {', '.join(transfer.EXPORT_LAYOUTS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        rows = transfer.iter_export(request.user, layout=layout)
+        response = StreamingHttpResponse(
+            transfer.iter_ndjson(rows, compress=compress),
+            content_type='application/gzip' if compress else 'application/x-ndjson',
+        )
+        filename = f"conversations-{layout}.jsonl" + ('.gz' if compress else '')
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    @action(detail=False, methods=['post'], url_path='import')
+    def import_conversations(self, request):
+        """Import an uploaded ``records`` NDJSON file (optionally gzipped)."""
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response(
+                {"error": "Upload an NDJSON file in the 'file' field"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            conversations, messages = transfer.import_records(
+                transfer.open_ndjson(upload.file), request.user
+            )
+        except (ValueError, OSError, EOFError) as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(
+            {"conversations": conversations, "messages": messages},
+            status=status.HTTP_201_CREATED
+        )
+
+# Coalesces identical in-flight chat submissions within this worker process;
+# idempotency.coalesce() does the same across workers.
+chat_flights = idempotency.SingleFlight()
+
+
 class ChatView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
@@ -132,23 +176,104 @@ class ChatView(APIView):
 
             logger.info(f"Received message: {user_message_content}")
 
-            # Get or create conversation
-            conversation = None
-            if conversation_id:
-                conversation = get_object_or_404(Conversation, id=conversation_id, user=request.user)
-            else:
-                conversation = Conversation.objects.create(
-                    user=request.user, 
-                    title=user_message_content[:50] # helper title
+            idempotency_key = request.headers.get("Idempotency-Key")
+            if idempotency_key and len(idempotency_key) > idempotency.MAX_KEY_LENGTH:
+                return Response(
+                    {"error": f"Idempotency-Key must be at most {idempotency.MAX_KEY_LENGTH} characters"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if idempotency_key and idempotency_key.startswith(idempotency.COALESCE_KEY_PREFIX):
+                return Response(
+                    {"error": f"Idempotency-Key must not start with '{idempotency.COALESCE_KEY_PREFIX}'"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if idempotency_key:
+                return self.post_idempotent(request, idempotency_key, user_message_content, conversation_id)
+
+            payload = self.submit_coalesced(request.user, user_message_content, conversation_id)
+            return Response(payload)
+
+        except Exception as e:
+            logger.error(f"Error generating response: {str(e)}")
+            logger.error(traceback.format_exc())
+            return Response(
+                {"error": "An error occurred while generating the response"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+    def post_idempotent(self, request, key, user_message_content, conversation_id):
+        """Replay the stored result for a key already seen, otherwise submit once."""
+        request_hash = idempotency.request_fingerprint(conversation_id, user_message_content)
+        record, created = idempotency.claim(request.user, key, request_hash)
+
+        if record.request_hash != request_hash:
+            return Response(
+                {"error": "Idempotency-Key was already used for a different request"},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY
+            )
+
+        if not created:
+            payload = record.response or idempotency.wait_for_result(record)
+            if payload is None:
+                return Response(
+                    {"error": "A request with this Idempotency-Key is still in progress"},
+                    status=status.HTTP_409_CONFLICT
                 )
+            logger.info(f"Replaying stored response for Idempotency-Key {key}")
+            return Response(payload, headers={"Idempotent-Replayed": "true"})
 
-            # Save user message
-            Message.objects.create(
-                conversation=conversation,
-                role='user',
-                content=user_message_content
+        try:
+            payload = self.submit_coalesced(request.user, user_message_content, conversation_id)
+        except Exception:
+            idempotency.release(record)
+            raise
+        idempotency.complete(record, payload)
+        return Response(payload)
+
+    def submit_coalesced(self, user, user_message_content, conversation_id):
+        """
+        Submit once for identical concurrent submissions: within this process
+        through ``chat_flights``, across workers through the database.
+        """
+        fingerprint = idempotency.request_fingerprint(user.id, conversation_id or "", user_message_content)
+        (payload, shared_across_workers), shared = chat_flights.do(
+            fingerprint,
+            lambda: idempotency.coalesce(
+                user, fingerprint, lambda: self.submit(user, user_message_content, conversation_id)
+            ),
+        )
+        if shared or shared_across_workers:
+            logger.info("Coalesced duplicate in-flight chat submission")
+        return payload
+
+    def submit(self, user, user_message_content, conversation_id):
+        """Persist the user message, call the model and persist its reply."""
+        # Get or create conversation
+        conversation = None
+        if conversation_id:
+            conversation = get_object_or_404(Conversation, id=conversation_id, user=user)
+            retention.rehydrate_conversation(conversation)
+        else:
+            conversation = Conversation.objects.create(
+                user=user,
+                title=user_message_content[:50] # helper title
             )
 
+        # Save user message
+        Message.objects.create(
+            conversation=conversation,
+            role='user',
+            content=user_message_content
+        )
+
+        # Only the opening message is gated: the classifier scores a message on
+        # its own, and short follow-ups ("what about for postgres?") lack the
+        # context that makes them database questions.
+        if not conversation_id and not domain_gate.is_on_topic(user_message_content):
+            # Off-topic: answer with the model's own refusal without calling it.
+            logger.info("Domain gate refused off-topic message")
+            response_text = domain_gate.REFUSAL_MESSAGE
+        else:
             try:
                 response_text: str = generate_model_response(user_message_content)
             except Exception as gen_err:
@@ -156,27 +281,19 @@ class ChatView(APIView):
                 logger.error(traceback.format_exc())
                 response_text = generate_fallback_response(user_message_content)
 
-            # Save assistant message
-            Message.objects.create(
-                conversation=conversation,
-                role='assistant',
-                content=response_text
-            )
-            
-            # Update conversation timestamp
-            conversation.save() # Updates updated_at
-
-            logger.info(f"Responding with: {response_text[:120]}...")
-            return Response({
-                "response": response_text,
-                "conversation_id": conversation.id,
-                "title": conversation.title
-            })
-
-        except Exception as e:
-            logger.error(f"Error generating response: {str(e)}")
-            logger.error(traceback.format_exc())
-            return Response(
-                {"error": "An error occurred while generating the response"},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
\ No newline at end of file
+        # Save assistant message
+        Message.objects.create(
+            conversation=conversation,
+            role='assistant',
+            content=response_text
+        )
+
+        # Update conversation timestamp
+        conversation.save(update_fields=['updated_at']) # Updates updated_at
+
+        logger.info(f"Responding with: {response_text[:120]}...")
+        return {
+            "response": response_text,
+            "conversation_id": conversation.id,
+            "title": conversation.title
+        }
@@ -0,0 +1,160 @@
+"""
+Measure what the nginx edge buys over hitting gunicorn directly.
+
+Runs the same API request mix against the edge (``--url``) and, optionally,
+the backend directly (``--baseline-url``), each from concurrent keep-alive
+clients, and reports latency percentiles, transferred bytes (gzip), the edge
+cache hit ratio and how many requests the edge rate-limited (429).
+
+``--upstream-url`` points at nginx's keep-alive comparison server (port 8081,
+published on localhost only). It proxies the same paths once through the
+pooled upstream (``/keepalive``) and once opening a connection per request
+(``/no-keepalive``), without caching or rate limits, so the difference
+between those two rows is what upstream keep-alive alone is worth.
+
+When given gunicorn's access log, it reports how many upstream requests
+reused a pooled connection: gunicorn logs the peer port of every request, and
+each distinct nginx source port is one upstream TCP connection. (nginx's ``$upstream_connect_time`` cannot tell: it has
+millisecond resolution and a fresh connect on the Docker network also logs
+0.000.)
+
+Usage (from sql-chat-app/backend, with docker-compose running):
+
+    python benchmarks/bench_edge.py --url http://localhost --baseline-url http://localhost:8000
+    python benchmarks/bench_edge.py --upstream-url http://localhost:8081 --token <access token>
+    docker compose logs --no-log-prefix backend > /tmp/backend.log
+    python benchmarks/bench_edge.py --backend-log /tmp/backend.log
+"""
+
+import argparse
+import http.client
+import re
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+# API paths only, so every target serves them from the same Django view.
+DEFAULT_PATHS = [
+    '/api/conversations/',
+    '/api/auth/user/',
+]
+
+# "<addr>:<port> - - [time] "GET ..."" as written by gunicorn.conf.py's
+# access_log_format; error log lines in the same stream do not match.
+ACCESS_LINE_RE = re.compile(r'^(\S+):(\d+) \S+ \S+ \[')
+
+
+def run_client(url, paths, count, token):
+    """Issue ``count`` GETs over one keep-alive connection, cycling ``paths``."""
+    parts = urlsplit(url)
+    prefix = parts.path.rstrip('/')
+    headers = {'Accept-Encoding': 'gzip'}
+    if token:
+        headers['Authorization'] = f'Bearer {token}'
+
+    samples = []
+    conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+    for i in range(count):
+        path = prefix + paths[i % len(paths)]
+        start = time.perf_counter()
+        try:
+            conn.request('GET', path, headers=headers)
+            response = conn.getresponse()
+            body = response.read()
+        except (http.client.HTTPException, OSError):
+            conn.close()
+            conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+            continue
+        samples.append({
+            'latency': time.perf_counter() - start,
+            'bytes': len(body),
+            'cache': response.getheader('X-Cache-Status', '-'),
+            'status': response.status,
+        })
+    conn.close()
+    return samples
+
+
+def bench(label, url, args):
+    per_client = max(1, args.requests // args.concurrency)
+    run_client(url, args.paths, 10, args.token)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        chunks = pool.map(
+            lambda _: run_client(url, args.paths, per_client, args.token),
+            range(args.concurrency),
+        )
+        samples = [s for chunk in chunks for s in chunk]
+    elapsed = time.perf_counter() - started
+
+    if not samples:
+        print(f"{label}: no successful requests")
+        return
+
+    latencies = sorted(s['latency'] for s in samples)
+    hits = sum(1 for s in samples if s['cache'] == 'HIT')
+    limited = sum(1 for s in samples if s['status'] == 429)
+    print(
+        f"{label:<14}{len(samples) / elapsed:>10.1f}"
+        f"{statistics.median(latencies) * 1000:>9.2f}"
+        f"{latencies[int(len(latencies) * 0.95) - 1] * 1000:>9.2f}"
+        f"{statistics.mean(s['bytes'] for s in samples):>11.0f}"
+        f"{hits / len(samples):>8.1%}"
+        f"{limited:>7}"
+    )
+
+
+def report_upstream_reuse(log_path):
+    """Compare requests gunicorn served with the connections they arrived on."""
+    requests = 0
+    connections = set()
+    with open(log_path, encoding='utf-8', errors='replace') as log:
+        for line in log:
+            match = ACCESS_LINE_RE.match(line)
+            if not match:
+                continue
+            requests += 1
+            connections.add(match.groups())
+
+    if not requests:
+        print("No gunicorn access log lines found (is access_log_format logging the peer port?)")
+        return
+    reused = requests - len(connections)
+    print(
+        f"Upstream requests: {requests}, connections: {len(connections)}, "
+        f"served on a reused connection: {reused} ({reused / requests:.1%})"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://localhost', help="nginx edge base URL")
+    parser.add_argument('--baseline-url', help="Backend base URL to compare against, e.g. http://localhost:8000")
+    parser.add_argument('--upstream-url',
+                        help="nginx keep-alive comparison server, e.g. http://localhost:8081")
+    parser.add_argument('--paths', nargs='+', default=DEFAULT_PATHS)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--token', help="JWT access token; authenticated requests bypass the micro-cache")
+    parser.add_argument('--backend-log', help="gunicorn access log, to report upstream connection reuse")
+    args = parser.parse_args()
+
+    if args.backend_log:
+        report_upstream_reuse(args.backend_log)
+        return
+
+    print(f"{'target':<14}{'req/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'avg bytes':>11}{'hits':>8}{'429':>7}")
+    if args.upstream_url:
+        base = args.upstream_url.rstrip('/')
+        bench('keepalive-off', f'{base}/no-keepalive', args)
+        bench('keepalive-on', f'{base}/keepalive', args)
+        return
+    if args.baseline_url:
+        bench('direct', args.baseline_url, args)
+    bench('edge', args.url, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+"""
+Compare gunicorn worker configurations for the sqlchat backend.
+
+Each configuration is started from ``gunicorn.conf.py`` with a different set
+of ``GUNICORN_*`` overrides, then hammered with concurrent keep-alive clients.
+The report lists boot time, worker memory (PSS, so pages shared through
+``preload_app`` are only counted once), throughput and latency percentiles.
+
+Two scenarios are run against each configuration:
+
+- ``fast``: ``--path`` (by default the cheap 401 of ``/api/conversations/``),
+  which measures per-request overhead.
+- ``slow-model``: the stub in ``benchmarks/slow_model.py`` that sleeps for
+  ``--model-delay`` seconds like a chat request waiting on the model. This is
+  the case the worker sizing is tuned for: throughput is bounded by how many
+  blocked requests the server holds at once.
+
+Usage (from sql-chat-app/backend):
+
+    python benchmarks/bench_server.py --requests 2000 --concurrency 32
+    python benchmarks/bench_server.py --scenario slow-model --model-delay 1.0
+"""
+
+import argparse
+import http.client
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import psutil
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+SLOW_MODEL_PATH = '/bench/slow-model/'
+SCENARIOS = ('fast', 'slow-model')
+
+CONFIGURATIONS = {
+    # What docker-compose ran before gunicorn.conf.py existed.
+    'baseline-sync': {
+        'GUNICORN_WORKER_CLASS': 'sync',
+        'GUNICORN_WORKERS': '1',
+        'GUNICORN_PRELOAD': '0',
+        'GUNICORN_KEEPALIVE': '2',
+    },
+    'sync-preload': {
+        'GUNICORN_WORKER_CLASS': 'sync',
+        'GUNICORN_PRELOAD': '1',
+    },
+    'gthread-preload': {
+        'GUNICORN_WORKER_CLASS': 'gthread',
+        'GUNICORN_PRELOAD': '1',
+    },
+    'uvicorn-preload': {
+        'GUNICORN_WORKER_CLASS': 'uvicorn',
+        'GUNICORN_PRELOAD': '1',
+    },
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=60):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return True
+        except OSError:
+            time.sleep(0.05)
+    return False
+
+
+def process_tree_pss(pid):
+    """Sum proportional set size (MiB) of the gunicorn master and its workers."""
+    master = psutil.Process(pid)
+    total = 0
+    for proc in [master] + master.children(recursive=True):
+        try:
+            total += proc.memory_full_info().pss
+        except (psutil.NoSuchProcess, AttributeError):
+            continue
+    return total / (1024 * 1024)
+
+
+def run_client(port, path, count):
+    """Issue ``count`` requests over one keep-alive connection."""
+    latencies = []
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    for _ in range(count):
+        start = time.perf_counter()
+        try:
+            conn.request('GET', path)
+            conn.getresponse().read()
+        except (http.client.HTTPException, OSError):
+            conn.close()
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            continue
+        latencies.append(time.perf_counter() - start)
+    conn.close()
+    return latencies
+
+
+def bench(name, overrides, scenario, args):
+    port = free_port()
+    env = os.environ.copy()
+    env.update(overrides)
+    env['GUNICORN_BIND'] = f'127.0.0.1:{port}'
+    env['GUNICORN_ACCESSLOG'] = ''
+    env['GUNICORN_LOGLEVEL'] = 'warning'
+
+    command = [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py']
+    if scenario == 'slow-model':
+        env['BENCH_MODEL_DELAY'] = str(args.model_delay)
+        app = 'asgi_application' if overrides['GUNICORN_WORKER_CLASS'] == 'uvicorn' else 'application'
+        command.append(f'benchmarks.slow_model:{app}')
+        path, total = SLOW_MODEL_PATH, args.slow_requests
+    else:
+        path, total = args.path, args.requests
+
+    started = time.perf_counter()
+    server = subprocess.Popen(command, cwd=BACKEND_DIR, env=env)
+    try:
+        if not wait_for_port(port):
+            print(f"{name}: server did not start")
+            return None
+        boot = time.perf_counter() - started
+
+        # Warm every worker before measuring.
+        run_client(port, path, 20 if scenario == 'fast' else 1)
+
+        per_client = max(1, total // args.concurrency)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            results = pool.map(lambda _: run_client(port, path, per_client), range(args.concurrency))
+            latencies = sorted(lat for chunk in results for lat in chunk)
+        elapsed = time.perf_counter() - started
+
+        return {
+            'name': name,
+            'scenario': scenario,
+            'boot_s': boot,
+            'pss_mib': process_tree_pss(server.pid),
+            'rps': len(latencies) / elapsed if elapsed else 0.0,
+            'p50_ms': statistics.median(latencies) * 1000 if latencies else 0.0,
+            'p95_ms': latencies[int(len(latencies) * 0.95) - 1] * 1000 if latencies else 0.0,
+            'errors': per_client * args.concurrency - len(latencies),
+        }
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--path', default='/api/conversations/',
+                        help="Endpoint for the fast scenario (the default returns a cheap 401 without touching the model)")
+    parser.add_argument('--scenario', nargs='*', choices=SCENARIOS, default=list(SCENARIOS),
+                        help="Scenarios to run (default: all)")
+    parser.add_argument('--model-delay', type=float, default=0.5,
+                        help="Seconds the slow-model stub blocks per request")
+    parser.add_argument('--slow-requests', type=int, default=256,
+                        help="Total requests for the slow-model scenario")
+    parser.add_argument('--only', nargs='*', choices=sorted(CONFIGURATIONS),
+                        help="Restrict the run to these configurations")
+    args = parser.parse_args()
+
+    rows = []
+    for scenario in args.scenario:
+        for name, overrides in CONFIGURATIONS.items():
+            if args.only and name not in args.only:
+                continue
+            result = bench(name, overrides, scenario, args)
+            if result:
+                rows.append(result)
+
+    print(
+        f"{'config':<18}{'scenario':<12}{'boot s':>8}{'PSS MiB':>10}{'req/s':>10}"
+        f"{'p50 ms':>9}{'p95 ms':>9}{'errors':>8}"
+    )
+    for row in rows:
+        print(
+            f"{row['name']:<18}{row['scenario']:<12}{row['boot_s']:>8.2f}{row['pss_mib']:>10.1f}{row['rps']:>10.1f}"
+            f"{row['p50_ms']:>9.2f}{row['p95_ms']:>9.2f}{row['errors']:>8}"
+        )
+
+
+if __name__ == '__main__':
+    main()
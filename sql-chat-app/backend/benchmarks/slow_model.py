@@ -0,0 +1,37 @@
+"""
+Benchmark entry points that add a stub endpoint standing in for a slow model call.
+
+``GET /bench/slow-model/`` is a plain synchronous Django view that sleeps for
+``BENCH_MODEL_DELAY`` seconds, the way ChatView blocks on the Gradio Space.
+It needs no auth or database, so ``bench_server.py`` can measure how many
+blocked requests each worker configuration serves at once.
+
+    gunicorn --config gunicorn.conf.py benchmarks.slow_model:application
+    gunicorn --config gunicorn.conf.py benchmarks.slow_model:asgi_application
+"""
+
+import os
+import time
+
+from django.core.asgi import get_asgi_application
+from django.core.wsgi import get_wsgi_application
+from django.http import HttpResponse
+from django.urls import path
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'sqlchat.settings')
+
+MODEL_DELAY = float(os.getenv('BENCH_MODEL_DELAY', '0.5'))
+
+
+def slow_model(request):
+    time.sleep(MODEL_DELAY)
+    return HttpResponse('ok', content_type='text/plain')
+
+
+application = get_wsgi_application()
+asgi_application = get_asgi_application()
+
+# Registered before the first request, so the resolver picks it up.
+from sqlchat import urls  # noqa: E402
+
+urls.urlpatterns.append(path('bench/slow-model/', slow_model))
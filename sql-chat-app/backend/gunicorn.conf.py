@@ -0,0 +1,135 @@
+"""
+Gunicorn configuration for the sqlchat backend.
+
+Gunicorn picks this file up automatically when started from the backend
+directory (``gunicorn --config gunicorn.conf.py``). Every value can be
+overridden through a ``GUNICORN_*`` environment variable, set in the process
+environment or in the same .env file the Django settings read, so
+docker-compose and the VPS deploy script share one source of truth.
+
+Worker model
+------------
+Chat requests spend almost all of their time waiting on the remote Gradio
+Space, so the default worker class is ``gthread``: a few processes, each
+with a pool of threads that can block on the model call without starving
+other requests. Set ``GUNICORN_WORKER_CLASS=uvicorn`` to serve the ASGI
+application through uvicorn workers instead. The app has no async views, so
+under ASGI every DRF view still runs in a thread through ``sync_to_async``;
+uvicorn buys no extra concurrency here and its workers are sized like sync
+ones.
+"""
+
+import multiprocessing
+import os
+
+from sqlchat.env import load_environment
+
+# Read .env before any GUNICORN_* value, so the knobs documented in
+# env.example apply and match what Django settings see.
+load_environment()
+
+CPU_COUNT = multiprocessing.cpu_count()
+
+WORKER_CLASSES = {
+    'sync': ('sync', 'sqlchat.wsgi:application'),
+    'gthread': ('gthread', 'sqlchat.wsgi:application'),
+    'uvicorn': ('uvicorn.workers.UvicornWorker', 'sqlchat.asgi:application'),
+}
+
+
+def env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def env_bool(name, default):
+    value = os.getenv(name)
+    if value is None or value == '':
+        return default
+    return value.lower() in ('1', 'true', 'yes', 'on')
+
+
+_worker_kind = os.getenv('GUNICORN_WORKER_CLASS', 'gthread').lower()
+if _worker_kind not in WORKER_CLASSES:
+    raise ValueError(
+        f"Unsupported GUNICORN_WORKER_CLASS '{_worker_kind}'. "
+        f"Choose one of: {', '.join(WORKER_CLASSES)}"
+    )
+
+worker_class, wsgi_app = WORKER_CLASSES[_worker_kind]
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+
+# Threaded workers already multiplex blocking model calls, so one process per
+# core (plus one) is enough. Sync workers need the classic 2 * cores + 1;
+# uvicorn gets the same, since with no async views it has no event-loop
+# concurrency to exploit.
+if _worker_kind == 'gthread':
+    workers = env_int('GUNICORN_WORKERS', CPU_COUNT + 1)
+else:
+    workers = env_int('GUNICORN_WORKERS', CPU_COUNT * 2 + 1)
+
+# Only used by gthread; the I/O-bound model call is what the threads wait on.
+threads = env_int('GUNICORN_THREADS', 4 if _worker_kind == 'gthread' else 1)
+
+# Import Django, DRF and gradio_client once in the master and let workers
+# share those pages copy-on-write.
+preload_app = env_bool('GUNICORN_PRELOAD', True)
+
+# Model calls to a cold Space can take well over a minute. Reloads, redeploys
+# and max_requests recycling wait as long for in-flight chats to finish.
+timeout = env_int('GUNICORN_TIMEOUT', 180)
+graceful_timeout = env_int('GUNICORN_GRACEFUL_TIMEOUT', timeout)
+
+# nginx keeps an upstream pool open, so hold idle connections a little longer
+# than gunicorn's 2 second default.
+keepalive = env_int('GUNICORN_KEEPALIVE', 15)
+
+# Recycle workers periodically to cap slow memory growth; jitter keeps them
+# from restarting all at once.
+max_requests = env_int('GUNICORN_MAX_REQUESTS', 1000)
+max_requests_jitter = env_int('GUNICORN_MAX_REQUESTS_JITTER', 100)
+
+# An empty GUNICORN_ACCESSLOG disables access logging.
+accesslog = os.getenv('GUNICORN_ACCESSLOG', '-') or None
+# Gunicorn's default format with the peer port added: every distinct nginx
+# source port is one upstream connection, which is how the edge benchmark
+# measures keep-alive reuse.
+access_log_format = os.getenv(
+    'GUNICORN_ACCESS_LOG_FORMAT',
+    '%(h)s:%({remote_port}e)s %(l)s %(u)s %(t)s "%(r)s" %(s)s %(b)s "%(f)s" "%(a)s"',
+)
+errorlog = os.getenv('GUNICORN_ERRORLOG', '-')
+loglevel = os.getenv('GUNICORN_LOGLEVEL', 'info')
+
+
+def when_ready(server):
+    """
+    Resolve the URLconf and load the domain gate in the master so the views
+    module (and everything it imports) is loaded before workers are forked.
+    """
+    if not preload_app:
+        return
+
+    from django.urls import get_resolver
+
+    from api.domain_gate import get_classifier
+
+    get_resolver().url_patterns
+    get_classifier()
+    server.log.info(
+        f"Preloaded sqlchat ({worker_class}, workers={workers}, threads={threads})"
+    )
+
+
+def post_fork(server, worker):
+    """Drop resources that must not be shared across forked workers."""
+    if not preload_app:
+        return
+
+    from django.db import connections
+
+    from api.views import reset_gradio_client
+
+    connections.close_all()
+    reset_gradio_client()
@@ -0,0 +1,45 @@
+"""
+.env loading shared by the Django settings and gunicorn.conf.py.
+
+gunicorn reads its ``GUNICORN_*`` knobs when the config file is loaded, before
+Django settings are imported, so both call ``load_environment`` to see the
+same values.
+"""
+
+import logging
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+ENV_FILE_PATHS = [
+    BASE_DIR / '.env',
+    BASE_DIR.parent / '.env',
+    Path('.env'),
+]
+
+_loaded_from = None
+
+
+def load_environment():
+    """
+    Load environment variables from the first .env file found, once per
+    process. Returns True if a file was loaded.
+    """
+    global _loaded_from
+    if _loaded_from is not None:
+        return bool(_loaded_from)
+
+    for path in ENV_FILE_PATHS:
+        if path.exists():
+            load_dotenv(dotenv_path=path, override=True)
+            logger.info(f"Loaded .env file from: {path}")
+            _loaded_from = path
+            return True
+
+    logger.warning("No .env file found")
+    _loaded_from = ''
+    return False
@@ -14,9 +14,14 @@ import os
 from pathlib import Path
 from datetime import timedelta
 
+from .env import load_environment
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# Load .env once per process; a no-op when gunicorn.conf.py already did.
+load_environment()
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.0/howto/deployment/checklist/
@@ -60,6 +65,7 @@ CORS_ALLOW_HEADERS = [
     'x-csrftoken',
     'x-requested-with',
     'access-control-allow-origin',
+    'idempotency-key',
 ]
 
 CORS_ALLOW_METHODS = [
@@ -210,3 +216,37 @@ EMAIL_USE_TLS = True
 EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD')
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
+
+# Hugging Face Gradio Space backing the chat model
+HF_TOKEN = os.getenv('HF_TOKEN')
+GRADIO_SPACE = os.getenv('GRADIO_SPACE', 'saadkhi/SQL_chatbot_API')
+
+# Conversation retention (see api/retention.py)
+# Conversations untouched for this many days have their messages moved to
+# zstd-compressed ConversationArchive rows by `manage.py archive_conversations`.
+CONVERSATION_ARCHIVE_AFTER_DAYS = int(os.getenv('CONVERSATION_ARCHIVE_AFTER_DAYS', '90'))
+CONVERSATION_ARCHIVE_BATCH_SIZE = int(os.getenv('CONVERSATION_ARCHIVE_BATCH_SIZE', '100'))
+CONVERSATION_ARCHIVE_ZSTD_LEVEL = int(os.getenv('CONVERSATION_ARCHIVE_ZSTD_LEVEL', '10'))
+
+# Chat submissions carrying an Idempotency-Key header are replayed from the
+# stored result for this long (see api/idempotency.py).
+CHAT_IDEMPOTENCY_TTL_SECONDS = int(os.getenv('CHAT_IDEMPOTENCY_TTL_SECONDS', '86400'))
+# How long a duplicate waits for the original in-flight request before 409.
+CHAT_IDEMPOTENCY_WAIT_SECONDS = int(os.getenv('CHAT_IDEMPOTENCY_WAIT_SECONDS', '30'))
+# An in-flight key not completed within this many seconds is treated as
+# abandoned (its worker died) and can be claimed again; only completed results
+# live for the full TTL. Defaults to the gunicorn timeout.
+CHAT_IDEMPOTENCY_LEASE_SECONDS = int(
+    os.getenv('CHAT_IDEMPOTENCY_LEASE_SECONDS') or os.getenv('GUNICORN_TIMEOUT') or '180'
+)
+# Submissions without a key are still coalesced across workers: an identical
+# submission arriving while the first is in flight, or up to this many seconds
+# after it finished, shares its result instead of calling the model again.
+CHAT_COALESCE_WINDOW_SECONDS = int(os.getenv('CHAT_COALESCE_WINDOW_SECONDS', '5'))
+
+# Domain gate: refuse non-database prompts without calling the model
+# (see api/domain_gate.py). DOMAIN_GATE_THRESHOLD overrides the threshold
+# stored in the artifact.
+DOMAIN_GATE_ENABLED = os.getenv('DOMAIN_GATE_ENABLED', '1').lower() in ('1', 'true', 'yes', 'on')
+DOMAIN_GATE_MODEL_PATH = os.getenv('DOMAIN_GATE_MODEL_PATH', str(BASE_DIR / 'api' / 'data' / 'domain_classifier.json'))
+DOMAIN_GATE_THRESHOLD = float(os.environ['DOMAIN_GATE_THRESHOLD']) if os.getenv('DOMAIN_GATE_THRESHOLD') else None
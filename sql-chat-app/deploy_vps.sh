@@ -20,7 +20,7 @@ pip install gunicorn
 python manage.py check
 
 # Run with Gunicorn (persistent)
-gunicorn --workers 2 --bind 0.0.0.0:8000 sqlchat_api.wsgi:application
+gunicorn --config gunicorn.conf.py
 
 # In another terminal: build & serve React
 cd ../frontend
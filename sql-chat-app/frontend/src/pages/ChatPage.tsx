@@ -110,13 +110,21 @@ const ChatPage: React.FC = () => {
     // Add user message to chat immediately
     setMessages((prev) => [...prev, { role: 'user', content: userMessage }]);
 
+    // One key per submission; retries of this request (e.g. after a token
+    // refresh) reuse it so the server does not store duplicate messages.
+    // crypto.randomUUID is only available in secure contexts (https/localhost).
+    const idempotencyKey =
+      crypto.randomUUID?.() ?? `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+
     try {
       const payload: any = { message: userMessage };
       if (currentConversationId) {
         payload.conversation_id = currentConversationId;
       }
 
-      const response = await api.post('/chat/', payload);
+      const response = await api.post('/chat/', payload, {
+        headers: { 'Idempotency-Key': idempotencyKey },
+      });
 
       if (response.data && response.data.response) {
         setMessages((prev) => [
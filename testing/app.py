@@ -3,6 +3,8 @@ from transformers import AutoModelForCausalLM, AutoTokenizer
 from peft import PeftModel
 import torch
 
+from generation_control import GenerationBudget, format_payload, generate_reply
+
 # Load model ONCE at startup (your exact setup)
 base_model_name = "unsloth/Phi-3-mini-4k-instruct-bnb-4bit"
 base_model = AutoModelForCausalLM.from_pretrained(
@@ -16,30 +18,22 @@ model = PeftModel.from_pretrained(base_model, "saadkhi/SQL_Chat_finetuned_model"
 tokenizer = AutoTokenizer.from_pretrained(base_model_name, trust_remote_code=True)
 model.eval()
 
+# Stop shortly after the SQL is complete; see generation_control.py
+GENERATION_BUDGET = GenerationBudget()
+
 def chat_fn(message, history):
-    # Format as Phi-3 chat
-    messages = [{"role": "user", "content": message}]
-    inputs = tokenizer.apply_chat_template(
-        messages,
-        tokenize=True,
-        add_generation_prompt=True,
-        return_tensors="pt"
-    ).to(model.device)
-    
-    # Generate response
-    outputs = model.generate(
-        inputs,
-        max_new_tokens=512,
+    # Generate under a SQL-aware budget instead of a flat 512 new tokens
+    result = generate_reply(
+        model,
+        tokenizer,
+        message,
+        budget=GENERATION_BUDGET,
         temperature=0.7,
         do_sample=True,
         top_p=0.9,
         repetition_penalty=1.1,
-        eos_token_id=tokenizer.eos_token_id,
     )
-    
-    # Decode and clean
-    response = tokenizer.decode(outputs[0], skip_special_tokens=False)
-    response = response.split("<|assistant|>")[-1].split("<|end|>")[0].strip()
+    response = format_payload(result.payload) or result.text
     
     # Update history
     history.append((message, response))
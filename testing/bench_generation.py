@@ -0,0 +1,113 @@
+"""
+Benchmark SQL-aware generation control against the old 512-token decode.
+
+For prompts sampled from dataset.jsonl, runs both the previous chat_fn
+generation (max_new_tokens=512, eos only, full re-decode + string split) and
+generate_reply() with the default GenerationBudget, then reports generated
+tokens, latency and how often the reply parsed into valid SQL.
+
+Usage (needs the same GPU setup as app.py):
+
+    python bench_generation.py --limit 50 --greedy
+"""
+
+import argparse
+import json
+import random
+import statistics
+import time
+from pathlib import Path
+
+import torch
+
+from app import model, tokenizer
+from generation_control import GenerationBudget, generate_reply, parse_reply
+
+DATASET = Path(__file__).resolve().parent.parent / 'datasets and Scripts' / 'dataset' / 'dataset.jsonl'
+REFUSAL_PREFIX = "Sorry, I can only answer"
+
+
+def baseline_reply(message, generate_kwargs):
+    """The generation chat_fn did before generation_control existed."""
+    inputs = tokenizer.apply_chat_template(
+        [{"role": "user", "content": message}],
+        tokenize=True,
+        add_generation_prompt=True,
+        return_tensors="pt"
+    ).to(model.device)
+
+    start = time.perf_counter()
+    with torch.inference_mode():
+        outputs = model.generate(
+            inputs,
+            max_new_tokens=512,
+            eos_token_id=tokenizer.eos_token_id,
+            **generate_kwargs,
+        )
+    response = tokenizer.decode(outputs[0], skip_special_tokens=False)
+    response = response.split("<|assistant|>")[-1].split("<|end|>")[0].strip()
+    seconds = time.perf_counter() - start
+    return response, outputs.shape[-1] - inputs.shape[-1], seconds
+
+
+def load_prompts(limit, seed):
+    with open(DATASET, encoding='utf-8') as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    # Refusal rows are short either way; benchmark the database questions.
+    prompts = [r['prompt'] for r in rows if not r['completion'].startswith(REFUSAL_PREFIX)]
+    random.Random(seed).shuffle(prompts)
+    return prompts[:limit]
+
+
+def summarize(name, tokens, seconds, valid_sql):
+    seconds = sorted(seconds)
+    print(
+        f"{name:<12}{statistics.mean(tokens):>12.1f}{statistics.mean(seconds):>10.2f}"
+        f"{seconds[len(seconds) // 2]:>10.2f}{seconds[int(len(seconds) * 0.95) - 1]:>10.2f}"
+        f"{valid_sql / len(tokens):>12.1%}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--limit', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--greedy', action='store_true', help="Disable sampling so both runs are comparable")
+    args = parser.parse_args()
+
+    if args.greedy:
+        generate_kwargs = {'do_sample': False, 'repetition_penalty': 1.1}
+    else:
+        generate_kwargs = {'do_sample': True, 'temperature': 0.7, 'top_p': 0.9, 'repetition_penalty': 1.1}
+
+    budget = GenerationBudget()
+    base_tokens, base_seconds, base_valid = [], [], 0
+    ctrl_tokens, ctrl_seconds, ctrl_valid = [], [], 0
+    stop_reasons = {}
+
+    for i, prompt in enumerate(load_prompts(args.limit, args.seed), start=1):
+        torch.manual_seed(args.seed + i)
+        text, tokens, seconds = baseline_reply(prompt, generate_kwargs)
+        base_tokens.append(tokens)
+        base_seconds.append(seconds)
+        base_valid += parse_reply(text)['sql'] is not None
+
+        torch.manual_seed(args.seed + i)
+        result = generate_reply(model, tokenizer, prompt, budget=budget, **generate_kwargs)
+        ctrl_tokens.append(result.new_tokens)
+        ctrl_seconds.append(result.seconds)
+        ctrl_valid += result.payload['sql'] is not None
+        stop_reasons[result.stop_reason] = stop_reasons.get(result.stop_reason, 0) + 1
+
+    print(f"{'':<12}{'new tokens':>12}{'mean s':>10}{'p50 s':>10}{'p95 s':>10}{'valid SQL':>12}")
+    summarize('baseline', base_tokens, base_seconds, base_valid)
+    summarize('controlled', ctrl_tokens, ctrl_seconds, ctrl_valid)
+
+    saved = 1 - sum(ctrl_tokens) / sum(base_tokens)
+    speedup = 1 - sum(ctrl_seconds) / sum(base_seconds)
+    print(f"Tokens saved: {saved:.1%}, latency reduction: {speedup:.1%}")
+    print("Stop reasons: " + ", ".join(f"{k}={v}" for k, v in sorted(stop_reasons.items())))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,294 @@
+"""
+Generation control for the SQL chat model.
+
+The fine-tuned model tends to keep talking after the query is done, and
+`chat_fn` used to allow 512 new tokens and re-decode the whole output to find
+the reply. This module:
+
+- stops generation once a complete SQL statement has been followed by at most
+  `trailing_tokens` of explanation, or once a reply without SQL has used its
+  `explanation_tokens` budget;
+- decodes the new tokens incrementally while generating, so the reply text is
+  never re-decoded from scratch;
+- parses the reply into a `{"sql": ..., "explanation": ...}` payload whose SQL
+  has been validated with sqlparse.
+"""
+
+import re
+import time
+from dataclasses import dataclass
+
+import sqlparse
+import torch
+from sqlparse import tokens as T
+from transformers import StoppingCriteria, StoppingCriteriaList
+
+# Where a SQL statement can start inside a mixed prose/SQL reply: at the start
+# of a line, or right after a code fence or a colon ("Here is the query:
+# SELECT ..."). A keyword in the middle of a sentence ("Avoid SELECT *; ...")
+# is prose. Case sensitive: the model writes SQL keywords in upper case. The
+# statement itself starts at group 1.
+SQL_START_RE = re.compile(
+    r"(?:^|(?<=[:`]))[ \t]*(SELECT|INSERT|UPDATE|DELETE|CREATE|ALTER|DROP|WITH|MERGE|"
+    r"TRUNCATE|GRANT|REVOKE|REPLACE)\b",
+    re.MULTILINE,
+)
+SQL_FENCE_RE = re.compile(r"```(?:sql)?\s*(.*?)```", re.IGNORECASE | re.DOTALL)
+SENTENCE_END_RE = re.compile(r"[.!?](?=\s|$)")
+# Keywords that do not give a statement any content of its own: "INSERT or
+# UPDATE;" names two statement types but is not a statement.
+CONNECTIVE_KEYWORDS = {'AND', 'OR', 'NOT'}
+
+
+@dataclass
+class GenerationBudget:
+    # Hard cap; dataset completions are at most ~100 tokens.
+    max_new_tokens: int = 192
+    # Tokens allowed after the last complete SQL statement.
+    trailing_tokens: int = 32
+    # Tokens allowed for a reply that has not started any SQL.
+    explanation_tokens: int = 128
+
+
+class IncrementalDecoder:
+    """
+    Decode a growing token sequence without re-decoding it from the start.
+
+    Keeps a small window of already-decoded tokens so that multi-token
+    characters and leading-space handling stay correct (the same approach as
+    transformers' TextStreamer).
+    """
+
+    def __init__(self, tokenizer, skip_special_tokens=True):
+        self.tokenizer = tokenizer
+        self.skip_special_tokens = skip_special_tokens
+        self.tokens = []
+        self.prefix_offset = 0
+        self.read_offset = 0
+        self.text = ''
+
+    def _decode(self, tokens):
+        return self.tokenizer.decode(tokens, skip_special_tokens=self.skip_special_tokens)
+
+    def feed(self, new_tokens):
+        """Append token ids and return the newly completed text."""
+        self.tokens.extend(new_tokens)
+        prefix_text = self._decode(self.tokens[self.prefix_offset:self.read_offset])
+        full_text = self._decode(self.tokens[self.prefix_offset:])
+        # An incomplete UTF-8 sequence decodes to U+FFFD; wait for more tokens.
+        if len(full_text) <= len(prefix_text) or full_text.endswith('�'):
+            return ''
+        delta = full_text[len(prefix_text):]
+        self.prefix_offset = self.read_offset
+        self.read_offset = len(self.tokens)
+        self.text += delta
+        return delta
+
+
+def is_statement(statement):
+    """
+    True if sqlparse recognises ``statement`` and it has something beyond its
+    leading keyword: a name, a literal or a clause keyword such as FROM, so
+    that "SELECT *;" or "DELETE;" in prose are not taken for SQL.
+    """
+    parsed = sqlparse.parse(statement)[0]
+    if parsed.get_type() == 'UNKNOWN':
+        return False
+    for token in parsed.flatten():
+        if token.ttype in T.Name or token.ttype in T.Literal:
+            return True
+        if (token.ttype in T.Keyword and token.ttype not in (T.Keyword.DML, T.Keyword.DDL, T.Keyword.CTE)
+                and token.normalized not in CONNECTIVE_KEYWORDS):
+            return True
+    return False
+
+
+def _find_statements(text):
+    """
+    Return ``(start, statements)`` for the first place in ``text`` where
+    complete SQL statements start, or ``(None, [])``.
+    """
+    for match in SQL_START_RE.finditer(text):
+        start = match.start(1)
+        statements = []
+        for statement in sqlparse.split(text[start:]):
+            statement = statement.strip()
+            if not statement.endswith(';') or not is_statement(statement):
+                break
+            statements.append(statement)
+        if statements:
+            return start, statements
+    return None, []
+
+
+def complete_statements(text):
+    """
+    Return the complete (``;``-terminated, recognised) SQL statements found
+    from the first place in ``text`` where a statement starts.
+    """
+    return _find_statements(text)[1]
+
+
+class SQLStoppingCriteria(StoppingCriteria):
+    """
+    Stop once the reply has finished its SQL (plus a short explanation) or has
+    spent its explanation budget. Supports batch size 1, which is how chat_fn
+    generates.
+    """
+
+    def __init__(self, tokenizer, prompt_length, budget=None):
+        self.decoder = IncrementalDecoder(tokenizer)
+        self.prompt_length = prompt_length
+        self.budget = budget or GenerationBudget()
+        self.sql_started = False
+        self.statement_count = 0
+        self.tokens_since_statement = None
+        self.stop_reason = None
+
+    @property
+    def new_tokens(self):
+        return len(self.decoder.tokens)
+
+    def _should_stop(self):
+        if self.tokens_since_statement is not None:
+            if self.tokens_since_statement >= self.budget.trailing_tokens:
+                self.stop_reason = 'sql_complete'
+                return True
+        elif not self.sql_started and self.new_tokens >= self.budget.explanation_tokens:
+            self.stop_reason = 'explanation_budget'
+            return True
+        return False
+
+    def __call__(self, input_ids, scores, **kwargs):
+        fresh = input_ids[0, self.prompt_length + self.new_tokens:].tolist()
+        delta = self.decoder.feed(fresh)
+
+        if self.tokens_since_statement is not None:
+            self.tokens_since_statement += len(fresh)
+
+        # A SQL statement in progress may use the whole max_new_tokens budget.
+        if not self.sql_started:
+            self.sql_started = SQL_START_RE.search(self.decoder.text) is not None
+
+        # Only re-parse when a statement could just have ended.
+        if ';' in delta:
+            statements = complete_statements(self.decoder.text)
+            if len(statements) > self.statement_count:
+                # Each new statement resets the trailing budget, so multi
+                # statement answers are not cut after the first one.
+                self.statement_count = len(statements)
+                self.tokens_since_statement = 0
+
+        stop = self._should_stop()
+        return torch.full((input_ids.shape[0],), stop, dtype=torch.bool, device=input_ids.device)
+
+
+def _trim_partial_sentence(text):
+    """
+    Drop a dangling half sentence left by a budget cut. Text without any
+    sentence end is a fragment only, so nothing is kept.
+    """
+    ends = list(SENTENCE_END_RE.finditer(text))
+    if not ends:
+        return ''
+    return text[:ends[-1].end()]
+
+
+def _join(*parts):
+    return '\n'.join(part.strip() for part in parts if part.strip())
+
+
+def parse_reply(text, truncated=False):
+    """
+    Split a model reply into ``{"sql": ..., "explanation": ...}``.
+
+    ``sql`` holds the statements sqlparse recognises (from a ```sql fence if
+    the model used one), or None. ``explanation`` is the remaining prose, or
+    None when there is none.
+    """
+    text = text.strip()
+    sql = None
+    explanation = text
+
+    fence = SQL_FENCE_RE.search(text)
+    if fence:
+        statements = [s.strip() for s in sqlparse.split(fence.group(1)) if s.strip()]
+        if statements and all(is_statement(s) for s in statements):
+            sql = '\n'.join(statements)
+            explanation = _join(text[:fence.start()], text[fence.end():])
+    else:
+        start, statements = _find_statements(text)
+        if statements:
+            end = start
+            for statement in statements:
+                end = text.index(statement, end) + len(statement)
+            sql = '\n'.join(statements)
+            explanation = _join(text[:start], text[end:])
+
+    if explanation and truncated:
+        explanation = _trim_partial_sentence(explanation)
+    return {'sql': sql, 'explanation': explanation or None}
+
+
+def format_payload(payload):
+    """Render a parsed reply for the chat UI."""
+    parts = []
+    if payload['sql']:
+        parts.append(f"```sql\n{payload['sql']}\n```")
+    if payload['explanation']:
+        parts.append(payload['explanation'])
+    return '\n\n'.join(parts)
+
+
+@dataclass
+class GenerationResult:
+    text: str
+    payload: dict
+    new_tokens: int
+    stop_reason: str
+    seconds: float
+
+
+def generate_reply(model, tokenizer, message, budget=None, **generate_kwargs):
+    """Generate a reply for ``message`` under ``budget`` and parse it."""
+    budget = budget or GenerationBudget()
+    inputs = tokenizer.apply_chat_template(
+        [{"role": "user", "content": message}],
+        tokenize=True,
+        add_generation_prompt=True,
+        return_tensors="pt"
+    ).to(model.device)
+
+    criteria = SQLStoppingCriteria(tokenizer, inputs.shape[-1], budget)
+    # Phi-3 ends a turn with <|end|>, which is not its eos token.
+    eos_ids = [tokenizer.eos_token_id]
+    end_id = tokenizer.convert_tokens_to_ids("<|end|>")
+    if end_id is not None and end_id != tokenizer.unk_token_id:
+        eos_ids.append(end_id)
+
+    start = time.perf_counter()
+    with torch.inference_mode():
+        outputs = model.generate(
+            inputs,
+            max_new_tokens=budget.max_new_tokens,
+            stopping_criteria=StoppingCriteriaList([criteria]),
+            eos_token_id=eos_ids,
+            **generate_kwargs,
+        )
+    seconds = time.perf_counter() - start
+
+    # Feed whatever the last criteria call did not see (the final token).
+    criteria.decoder.feed(outputs[0, inputs.shape[-1] + criteria.new_tokens:].tolist())
+    stop_reason = criteria.stop_reason
+    if stop_reason is None:
+        stop_reason = 'eos' if criteria.new_tokens < budget.max_new_tokens else 'max_new_tokens'
+
+    text = criteria.decoder.text.strip()
+    truncated = stop_reason in ('explanation_budget', 'max_new_tokens', 'sql_complete')
+    return GenerationResult(
+        text=text,
+        payload=parse_reply(text, truncated=truncated),
+        new_tokens=criteria.new_tokens,
+        stop_reason=stop_reason,
+        seconds=seconds,
+    )
@@ -0,0 +1,109 @@
+"""
+Unit tests for generation_control's reply parsing and incremental decoding.
+
+Run from this directory with the Space requirements installed:
+
+    python -m unittest test_generation_control
+"""
+
+import unittest
+
+from generation_control import IncrementalDecoder, complete_statements, parse_reply
+
+
+class ByteTokenizer:
+    """One token per UTF-8 byte, so a character can span several tokens."""
+
+    def encode(self, text):
+        return list(text.encode('utf-8'))
+
+    def decode(self, tokens, skip_special_tokens=True):
+        return bytes(tokens).decode('utf-8', errors='replace')
+
+
+class CompleteStatementsTests(unittest.TestCase):
+    def test_statement_after_prose_line(self):
+        text = "Here is the query:\nSELECT name FROM users WHERE age > 30;\nIt filters by age."
+        self.assertEqual(complete_statements(text), ['SELECT name FROM users WHERE age > 30;'])
+
+    def test_statement_after_colon(self):
+        self.assertEqual(complete_statements("Run this: DELETE FROM logs;"), ['DELETE FROM logs;'])
+
+    def test_multiple_statements(self):
+        text = "CREATE TABLE t (id INT);\nINSERT INTO t VALUES (1);"
+        self.assertEqual(complete_statements(text), ['CREATE TABLE t (id INT);', 'INSERT INTO t VALUES (1);'])
+
+    def test_unterminated_statement_is_not_complete(self):
+        self.assertEqual(complete_statements("SELECT name FROM users WHERE"), [])
+
+    def test_keyword_inside_a_sentence_is_prose(self):
+        self.assertEqual(complete_statements("Avoid SELECT *; list the columns you need."), [])
+        self.assertEqual(complete_statements("Triggers run on events like INSERT or UPDATE; they fire per row."), [])
+
+    def test_statement_needs_more_than_its_keyword(self):
+        self.assertEqual(complete_statements("SELECT *; is slow on wide tables."), [])
+        self.assertEqual(complete_statements("INSERT or UPDATE; both fire triggers."), [])
+
+    def test_prose_false_start_does_not_hide_later_statement(self):
+        text = "Note: SELECT *; is discouraged.\nSELECT id FROM orders;"
+        self.assertEqual(complete_statements(text), ['SELECT id FROM orders;'])
+
+
+class ParseReplyTests(unittest.TestCase):
+    def test_fenced_sql(self):
+        text = "Use a join.\n```sql\nSELECT o.id FROM orders o JOIN users u ON u.id = o.user_id;\n```\nDone."
+        self.assertEqual(parse_reply(text), {
+            'sql': 'SELECT o.id FROM orders o JOIN users u ON u.id = o.user_id;',
+            'explanation': 'Use a join.\nDone.',
+        })
+
+    def test_unfenced_sql_splits_out_explanation(self):
+        text = "To count users:\nSELECT COUNT(*) FROM users;\nThis returns one row."
+        self.assertEqual(parse_reply(text), {
+            'sql': 'SELECT COUNT(*) FROM users;',
+            'explanation': 'To count users:\nThis returns one row.',
+        })
+
+    def test_prose_mentioning_keywords_has_no_sql(self):
+        text = "Avoid SELECT *; list the columns you need instead."
+        self.assertEqual(parse_reply(text), {'sql': None, 'explanation': text})
+
+    def test_truncated_explanation_drops_partial_sentence(self):
+        text = "SELECT 1;\nThis returns one. The second sentence was cut"
+        self.assertEqual(parse_reply(text, truncated=True), {'sql': 'SELECT 1;', 'explanation': 'This returns one.'})
+
+    def test_truncated_fragment_without_sentence_end_is_dropped(self):
+        self.assertEqual(parse_reply("SELECT 1;\nThis returns", truncated=True), {'sql': 'SELECT 1;', 'explanation': None})
+
+
+class IncrementalDecoderTests(unittest.TestCase):
+    def setUp(self):
+        self.tokenizer = ByteTokenizer()
+
+    def test_deltas_add_up_to_full_decode(self):
+        text = "SELECT name FROM users;"
+        decoder = IncrementalDecoder(self.tokenizer)
+        deltas = [decoder.feed([token]) for token in self.tokenizer.encode(text)]
+
+        self.assertEqual(''.join(deltas), text)
+        self.assertEqual(decoder.text, text)
+
+    def test_waits_for_the_rest_of_a_multibyte_character(self):
+        decoder = IncrementalDecoder(self.tokenizer)
+        first, second = self.tokenizer.encode('é')
+
+        self.assertEqual(decoder.feed([first]), '')
+        self.assertEqual(decoder.feed([second]), 'é')
+        self.assertEqual(decoder.text, 'é')
+
+    def test_feeds_of_several_tokens(self):
+        tokens = self.tokenizer.encode("café → SELECT 1;")
+        decoder = IncrementalDecoder(self.tokenizer)
+        for i in range(0, len(tokens), 3):
+            decoder.feed(tokens[i:i + 3])
+
+        self.assertEqual(decoder.text, "café → SELECT 1;")
+
+
+if __name__ == '__main__':
+    unittest.main()